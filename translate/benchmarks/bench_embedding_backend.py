@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+@File    : bench_embedding_backend.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/09/24 10:30
+"""
+
+"""
+对比 PyTorch 与 int8 量化 ONNX Runtime 向量模型后端的延迟、吞吐与检索一致性。
+
+- 单条延迟：逐条编码查询，统计 p50 / p95；
+- 批量吞吐：以 batch_size 编码整个语料，统计句/秒；
+- 检索一致性：两个后端各自在语料上做余弦 top-k，统计与 PyTorch 结果的重合率，
+  以及同一文本两种向量之间的平均余弦相似度。
+
+用法（在 translate 目录下执行）:
+    python benchmarks/bench_embedding_backend.py
+    python benchmarks/bench_embedding_backend.py --csv data/glossary.csv --limit 5000 --threads 4
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.config import Config
+from embedding_backend import load_embedding_model, TORCH, ONNX_INT8
+
+MODEL_PATH = "./models/embeddings"
+
+SAMPLE_SENTENCES = [
+    "The quick brown fox jumps over the lazy dog.",
+    "机器翻译需要严格遵守术语表。",
+    "Please translate the following paragraph into Chinese.",
+    "今天的天气非常好，我们去公园散步吧。",
+    "The neural network was trained on a large multilingual corpus.",
+    "这本书讲述了一个关于勇气和友谊的故事。",
+    "Retrieval augmented generation improves terminology consistency.",
+    "请把这段话翻译成英文。",
+    "Our company was founded in 2010 and now has offices worldwide.",
+    "向量检索可以找到语义相近的句子。",
+]
+
+
+def load_corpus(csv_path: str, limit: int):
+    if csv_path:
+        return pd.read_csv(csv_path, usecols=["source"], nrows=limit)["source"].astype(str).tolist()
+    # 没有提供语料时用示例句子拼出若干变体
+    corpus = []
+    for i in range(max(1, limit // len(SAMPLE_SENTENCES))):
+        corpus.extend(f"{sentence} ({i})" for sentence in SAMPLE_SENTENCES)
+    return corpus[:limit]
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def measure(model, corpus, queries, batch_size: int, warmup: int) -> dict:
+    for query in queries[:warmup]:
+        model.encode([query])
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        model.encode([query])
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    start = time.perf_counter()
+    corpus_vectors = np.asarray(model.encode(corpus, batch_size=batch_size), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "mean_ms": statistics.mean(latencies),
+        "throughput": len(corpus) / elapsed,
+        "corpus_vectors": normalize(corpus_vectors),
+        "query_vectors": normalize(np.asarray(model.encode(queries, batch_size=batch_size), dtype=np.float32)),
+    }
+
+
+def top_k(query_vectors: np.ndarray, corpus_vectors: np.ndarray, k: int) -> np.ndarray:
+    scores = query_vectors @ corpus_vectors.T
+    k = min(k, corpus_vectors.shape[0])
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量模型后端对比")
+    parser.add_argument("--csv", help="含 source 列的 CSV 语料，缺省使用内置示例句子")
+    parser.add_argument("--limit", type=int, default=2000, help="语料条数")
+    parser.add_argument("--queries", type=int, default=200, help="查询条数（取自语料）")
+    parser.add_argument("--batch-size", type=int, default=64, help="批量编码的 batch size")
+    parser.add_argument("-k", type=int, default=10, help="检索一致性的 top-k")
+    parser.add_argument("--warmup", type=int, default=10, help="预热次数")
+    parser.add_argument("--quantization", default=Config.EMBEDDING_ONNX_QUANTIZATION,
+                        help="ONNX int8 量化配置（arm64 / avx2 / avx512 / avx512_vnni）")
+    parser.add_argument("--threads", type=int, default=Config.EMBEDDING_ONNX_THREADS,
+                        help="ONNX Runtime 线程数，0 为自动")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.csv, args.limit)
+    rng = np.random.default_rng(0)
+    queries = [corpus[i] for i in rng.choice(len(corpus), size=min(args.queries, len(corpus)), replace=False)]
+    print(f"语料 {len(corpus)} 条，查询 {len(queries)} 条")
+
+    models = {
+        TORCH: load_embedding_model(MODEL_PATH, backend=TORCH),
+        ONNX_INT8: load_embedding_model(MODEL_PATH, backend=ONNX_INT8, quantization=args.quantization,
+                                        threads=args.threads),
+    }
+    results = {name: measure(model, corpus, queries, args.batch_size, args.warmup) for name, model in models.items()}
+
+    reference = results[TORCH]
+    reference_top = top_k(reference["query_vectors"], reference["corpus_vectors"], args.k)
+
+    print(f"\n{'backend':<12}{'p50(ms)':>10}{'p95(ms)':>10}{'mean(ms)':>10}{'句/秒':>10}"
+          f"{f'top{args.k}重合':>10}{'余弦':>8}")
+    for name, r in results.items():
+        candidate_top = top_k(r["query_vectors"], r["corpus_vectors"], args.k)
+        overlap = np.mean([
+            len(set(a) & set(b)) / len(a) for a, b in zip(reference_top, candidate_top)
+        ])
+        cosine = float(np.mean(np.sum(r["corpus_vectors"] * reference["corpus_vectors"], axis=1)))
+        print(f"{name:<12}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['mean_ms']:>10.2f}"
+              f"{r['throughput']:>10.1f}{overlap:>10.3f}{cosine:>8.4f}")
+
+    speedup = results[ONNX_INT8]["throughput"] / reference["throughput"]
+    print(f"\nonnx-int8 批量吞吐为 torch 的 {speedup:.2f} 倍")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+@File    : bench_execution_mode.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/09/05 16:10
+"""
+
+"""
+对比 agent 模式（create_react_agent）与 direct 模式（直接调用聊天模型）的单次请求开销。
+
+默认使用一个立即返回固定译文的假模型，测得的耗时即为框架本身的额外开销；
+加 --live 参数时使用 Config.LLM_TYPE 对应的真实模型，测得端到端耗时。
+
+用法（在 translate 目录下执行）:
+    python benchmarks/bench_execution_mode.py -n 500
+    python benchmarks/bench_execution_mode.py -n 20 --live
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langgraph.prebuilt import create_react_agent
+
+from utils.config import Config
+
+SYSTEM_MESSAGE = SystemMessage(content="你是一个专业的中英翻译员，必须严格遵守用户提供的术语翻译规则。")
+PROMPT = "根据以上规则，将下面这段话翻译成中文:The quick brown fox jumps over the lazy dog."
+
+
+def build_llm(live: bool):
+    if live:
+        from utils.llms import get_llm
+        return get_llm(Config.LLM_TYPE)
+    return GenericFakeChatModel(messages=itertools.repeat(AIMessage(content="敏捷的棕色狐狸跳过了懒狗。")))
+
+
+async def run_agent(agent, prompt: str):
+    return await agent.ainvoke({"messages": [HumanMessage(content=prompt)]})
+
+
+async def run_direct(llm, prompt: str):
+    response = await llm.ainvoke([SYSTEM_MESSAGE, HumanMessage(content=prompt)])
+    return {"messages": [AIMessage(content=response.content)]}
+
+
+def payload_size(output_message: dict) -> int:
+    # 与 FastAPI 序列化方式一致：消息对象转为字典后计算 JSON 字节数
+    messages = [m.model_dump() for m in output_message["messages"]]
+    return len(json.dumps({"messages": messages}, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+async def measure(name: str, call, n: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        await call()
+    latencies = []
+    output = None
+    for _ in range(n):
+        start = time.perf_counter()
+        output = await call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "mode": name,
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "payload_bytes": payload_size(output),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="agent / direct 执行模式开销对比")
+    parser.add_argument("-n", type=int, default=200, help="每种模式的请求次数")
+    parser.add_argument("--warmup", type=int, default=10, help="预热次数")
+    parser.add_argument("--live", action="store_true", help="使用真实模型而非假模型")
+    args = parser.parse_args()
+
+    llm = build_llm(args.live)
+    agent = create_react_agent(model=llm, tools=[], prompt=SYSTEM_MESSAGE)
+
+    results = [
+        await measure("agent", lambda: run_agent(agent, PROMPT), args.n, args.warmup),
+        await measure("direct", lambda: run_direct(llm, PROMPT), args.n, args.warmup),
+    ]
+
+    print(f"{'mode':<8}{'mean(ms)':>12}{'p50(ms)':>12}{'p95(ms)':>12}{'payload(B)':>14}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['mean_ms']:>12.3f}{r['p50_ms']:>12.3f}{r['p95_ms']:>12.3f}{r['payload_bytes']:>14}")
+    saved = results[0]["mean_ms"] - results[1]["mean_ms"]
+    print(f"\ndirect 模式平均每次请求节省 {saved:.3f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+@File    : bench_vector_compression.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/09/29 16:30
+"""
+
+"""
+对比内存映射向量库在不同存储与压缩方式下的常驻内存、recall@k 与检索延迟。
+
+以 float32 不压缩的精确检索结果为基准：
+- float16: 原始向量以半精度存储；
+- sq8: int8 标量量化码字粗排 + 原始向量精确重排；
+- pq: 乘积量化码字粗排 + 原始向量精确重排。
+
+默认使用带聚类结构的随机向量（模拟句向量分布），也可以用 --npy 传入真实的向量矩阵，
+例如由 RAGManager.embedding_model.encode 导出的知识库向量。
+
+用法（在 translate 目录下执行）:
+    python benchmarks/bench_vector_compression.py -n 200000
+    python benchmarks/bench_vector_compression.py --npy glossary_vectors.npy -k 10 --rerank 20
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import MemmapVectorStore
+
+BATCH_ROWS = 10000
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    assign = rng.integers(0, clusters, size=n)
+    vectors = centers[assign] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+    # 模长与真实句向量一样不完全相同
+    return vectors * rng.uniform(0.8, 1.2, size=(n, 1)).astype(np.float32)
+
+
+def batches(vectors: np.ndarray):
+    for start in range(0, len(vectors), BATCH_ROWS):
+        block = vectors[start:start + BATCH_ROWS]
+        yield block, [{"row": start + i} for i in range(len(block))]
+
+
+def run(store: MemmapVectorStore, view, queries: np.ndarray, k: int, batch: int):
+    latencies, results = [], []
+    for start in range(0, len(queries), batch):
+        t0 = time.perf_counter()
+        hits = store.search({"bench": view}, queries[start:start + batch], k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        results.extend([meta["row"] for _, _, meta in query_hits] for query_hits in hits)
+    latencies.sort()
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量压缩方式对比")
+    parser.add_argument("--npy", help="(n, dim) 的 float32 向量矩阵，缺省生成合成数据")
+    parser.add_argument("-n", type=int, default=100000, help="合成向量条数")
+    parser.add_argument("--dim", type=int, default=384, help="合成向量维度")
+    parser.add_argument("--clusters", type=int, default=2000, help="合成数据的聚类数")
+    parser.add_argument("--queries", type=int, default=200, help="查询条数")
+    parser.add_argument("--batch", type=int, default=1, help="每次检索的查询条数")
+    parser.add_argument("-k", type=int, default=10, help="recall@k 的 k")
+    parser.add_argument("--rerank", type=int, default=10, help="粗排候选数为 k 的倍数")
+    parser.add_argument("--pq", type=int, nargs="+", default=[96, 48], help="乘积量化的子向量数")
+    args = parser.parse_args()
+
+    vectors = np.load(args.npy).astype(np.float32) if args.npy else \
+        synthetic_vectors(args.n, args.dim, args.clusters)
+    dim = vectors.shape[1]
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    # 查询取自语料并加噪，模拟与知识库句子相近但不相同的输入
+    queries = vectors[picks] + 0.1 * rng.normal(size=(len(picks), dim)).astype(np.float32)
+    print(f"向量 {len(vectors)} 条 × {dim} 维，查询 {len(queries)} 条，k={args.k}，重排倍数={args.rerank}")
+
+    configs = [("float32", "none", None), ("float16", "none", None), ("float32", "sq8", None)]
+    configs += [("float32", "pq", m) for m in args.pq if dim % m == 0]
+
+    rows = []
+    baseline = None
+    with tempfile.TemporaryDirectory() as root:
+        for dtype, compression, subvectors in configs:
+            store = MemmapVectorStore(
+                os.path.join(root, f"{dtype}_{compression}_{subvectors}"),
+                dtype=dtype,
+                compression=compression,
+                pq_subvectors=subvectors or 48,
+                rerank_factor=args.rerank
+            )
+            t0 = time.perf_counter()
+            view = store.write("bench", batches(vectors), dim)
+            build_s = time.perf_counter() - t0
+            run(store, view, queries[:min(10, len(queries))], args.k, args.batch)  # 预热
+            results, latencies = run(store, view, queries, args.k, args.batch)
+            if baseline is None:
+                baseline = results
+            recall = statistics.mean(len(set(r) & set(b)) / len(b) for r, b in zip(results, baseline))
+            label = f"{dtype}/{compression}" + (f"-{subvectors}" if subvectors else "")
+            rows.append((label, view.resident_bytes(), recall, latencies, build_s))
+
+    base_bytes = rows[0][1]
+    print(f"\n{'config':<18}{'常驻(MB)':>10}{'压缩比':>8}{f'recall@{args.k}':>11}"
+          f"{'p50(ms)':>10}{'p95(ms)':>10}{'构建(s)':>9}")
+    for label, resident, recall, latencies, build_s in rows:
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{label:<18}{resident / 2 ** 20:>10.1f}{base_bytes / resident:>8.1f}{recall:>11.4f}"
+              f"{p50:>10.2f}{p95:>10.2f}{build_s:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+@File    : embedding_backend.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/09/24 09:40
+"""
+
+"""
+向量模型推理后端模块：按配置加载 PyTorch 或 int8 量化 ONNX Runtime 版本的 SentenceTransformer。
+量化模型首次使用时在临时目录中从本地模型导出，只把 .onnx 文件复制到模型目录的 onnx/ 子目录下，
+不改动模型目录中的其他文件，之后直接加载。
+"""
+
+import os
+import glob
+import shutil
+import logging
+import tempfile
+
+from sentence_transformers import SentenceTransformer
+
+# 初始化日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+TORCH = "torch"
+ONNX_INT8 = "onnx-int8"
+BACKENDS = (TORCH, ONNX_INT8)
+
+
+def quantized_file_name(quantization: str) -> str:
+    """sentence-transformers 导出的 int8 量化模型在模型目录中的相对路径"""
+    return f"onnx/model_qint8_{quantization}.onnx"
+
+
+def export_onnx_int8(model_path: str, quantization: str) -> str:
+    """
+    将本地模型导出为 ONNX 并做 int8 动态量化，已存在时直接返回
+
+    Args:
+        model_path (str): 本地 SentenceTransformer 模型目录
+        quantization (str): 量化配置（arm64 / avx2 / avx512 / avx512_vnni）
+
+    Returns:
+        str: 量化模型相对模型目录的路径
+    """
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    file_name = quantized_file_name(quantization)
+    if os.path.exists(os.path.join(model_path, file_name)):
+        return file_name
+
+    logger.info(f"正在导出 int8 量化 ONNX 向量模型（{quantization}），仅首次需要...")
+    # save_pretrained 会重写 README、配置等顶层文件，导出到临时目录，避免改动原模型
+    # （这些文件参与持久化向量库的模型 ID 计算）
+    export_dir = tempfile.mkdtemp(prefix="onnx_export_")
+    try:
+        # 目录中没有 onnx/model.onnx 时 sentence-transformers 会从 PyTorch 权重导出
+        onnx_model = SentenceTransformer(model_path, backend="onnx", model_kwargs={"provider": "CPUExecutionProvider"})
+        onnx_model.save_pretrained(export_dir)
+        export_dynamic_quantized_onnx_model(onnx_model, quantization, export_dir)
+
+        target_dir = os.path.join(model_path, "onnx")
+        os.makedirs(target_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(export_dir, "onnx", "*.onnx")):
+            target = os.path.join(target_dir, os.path.basename(path))
+            if not os.path.exists(target):
+                # 先复制为临时文件再改名，并发启动的进程不会读到不完整的模型
+                partial = f"{target}.{os.getpid()}.tmp"
+                shutil.copyfile(path, partial)
+                os.replace(partial, target)
+    finally:
+        shutil.rmtree(export_dir, ignore_errors=True)
+    logger.info(f"量化模型已保存到 {os.path.join(model_path, file_name)}")
+    return file_name
+
+
+def load_embedding_model(model_path: str, backend: str = TORCH, quantization: str = "avx2",
+                         threads: int = 0) -> SentenceTransformer:
+    """
+    按后端加载向量模型
+
+    Args:
+        model_path (str): 本地 SentenceTransformer 模型目录
+        backend (str): torch 或 onnx-int8
+        quantization (str): onnx-int8 使用的量化配置
+        threads (int): ONNX Runtime 单个算子的线程数，0 表示自动
+
+    Returns:
+        SentenceTransformer: 接口一致的向量模型
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的向量模型后端: {backend}，可选 {BACKENDS}")
+
+    if backend == ONNX_INT8:
+        import onnxruntime as ort
+
+        file_name = export_onnx_int8(model_path, quantization)
+        session_options = ort.SessionOptions()
+        if threads > 0:
+            session_options.intra_op_num_threads = threads
+            session_options.inter_op_num_threads = 1
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        logger.info(f"使用 ONNX Runtime int8 向量模型: {file_name}，线程数: {threads or '自动'}")
+        return SentenceTransformer(
+            model_path,
+            backend="onnx",
+            model_kwargs={
+                "file_name": file_name,
+                "provider": "CPUExecutionProvider",
+                "session_options": session_options,
+            },
+        )
+
+    return SentenceTransformer(model_path, trust_remote_code=True)
+
+
+def backend_id(backend: str, quantization: str) -> str:
+    """用于区分不同后端产生的向量（持久化向量库的模型 ID 组成部分）"""
+    return f"{ONNX_INT8}-{quantization}" if backend == ONNX_INT8 else TORCH
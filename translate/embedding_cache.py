@@ -0,0 +1,254 @@
+"""
+@File    : embedding_cache.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/09/18 10:20
+"""
+
+"""
+向量缓存模块：
+- EmbeddingLRU: 规范化查询文本 → float32 向量的有界内存 LRU，避免对刚编码过的相同查询重复编码；
+- EmbeddingStore: 按 (模型 ID, 文本哈希) 寻址的持久化向量库，构建或重建知识库时复用已计算过的向量。
+"""
+
+import os
+import sys
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+# 初始化日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingLRU:
+    """
+    按内存占用（字节）限制容量的向量 LRU 缓存，线程安全。
+    向量统一存为只读的一维 float32 数组。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _entry_size(key: str, vector: np.ndarray) -> int:
+        return sys.getsizeof(key) + vector.nbytes
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """查询缓存，命中时将条目移到最近使用端"""
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return vector
+
+    def put(self, key: str, vector: np.ndarray):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1).copy()
+        vector.setflags(write=False)
+        size = self._entry_size(key, vector)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= self._entry_size(key, old)
+            self._entries[key] = vector
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key, old_vector = self._entries.popitem(last=False)
+                self._bytes -= self._entry_size(old_key, old_vector)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        """返回命中率、条目数与内存占用"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class EmbeddingStore:
+    """
+    内容寻址的持久化向量库，多个知识库共享。
+
+    - 向量按模型分别追加写入 <model_hash>.f32 文件（行优先的 float32 矩阵），读取时通过 np.memmap 映射；
+    - SQLite 索引记录 (模型 ID, 文本哈希) → 行号。
+    先写向量再提交索引，进程中断时最多留下未被索引的尾部数据，不会读到不完整的向量。
+    """
+
+    def __init__(self, store_dir: str, model_id: str, dim: int):
+        """
+        Args:
+            store_dir (str): 存储目录
+            model_id (str): 向量模型标识，模型或推理后端不同的向量互不复用
+            dim (int): 向量维度
+        """
+        self.model_id = model_id
+        self.dim = dim
+        self._row_bytes = dim * 4
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        os.makedirs(store_dir, exist_ok=True)
+        model_hash = hashlib.sha1(f"{model_id}:{dim}".encode("utf-8")).hexdigest()[:16]
+        self._vectors_path = os.path.join(store_dir, f"{model_hash}.f32")
+        self._conn = sqlite3.connect(os.path.join(store_dir, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, slot INTEGER NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+
+        # 以追加模式创建，不会清空其他进程已写入的数据；中断留下的不完整行
+        # 由 put_many 在 SQLite 写锁内截断，这里只按完整行计数
+        open(self._vectors_path, "ab").close()
+        self._rows = os.path.getsize(self._vectors_path) // self._row_bytes
+        self._mmap: Optional[np.memmap] = None
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _matrix(self) -> Optional[np.memmap]:
+        """返回覆盖全部已写入行的只读映射，文件增长后重新映射。调用方需持有锁"""
+        if self._rows == 0:
+            return None
+        if self._mmap is None or self._mmap.shape[0] < self._rows:
+            self._mmap = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+        return self._mmap
+
+    def _lookup_slots(self, hashes: List[str]) -> Dict[str, int]:
+        slots = {}
+        # SQLite 单条语句的参数数量有限，分批查询
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT text_hash, slot FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [self.model_id, *batch]
+            ).fetchall()
+            slots.update(rows)
+        return slots
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        批量读取向量，未命中的位置为 None
+        """
+        hashes = [self.text_hash(text) for text in texts]
+        with self._lock:
+            slots = self._lookup_slots(list(dict.fromkeys(hashes)))
+            # 其他进程追加的行：按文件大小刷新行数
+            if slots and max(slots.values()) >= self._rows:
+                self._rows = os.path.getsize(self._vectors_path) // self._row_bytes
+            matrix = self._matrix()
+            vectors = []
+            for text_hash in hashes:
+                slot = slots.get(text_hash)
+                vectors.append(np.array(matrix[slot]) if slot is not None and slot < self._rows else None)
+            hits = sum(vector is not None for vector in vectors)
+            self._hits += hits
+            self._misses += len(vectors) - hits
+            return vectors
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        """
+        批量写入向量，已存在的文本不重复写入
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
+        unique = {}
+        for text, vector in zip(texts, vectors):
+            unique.setdefault(self.text_hash(text), vector)
+        with self._lock:
+            # BEGIN IMMEDIATE 持有 SQLite 写锁，多个进程的追加写入因此串行，行号不会冲突
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._lookup_slots(list(unique))
+                fresh = [(text_hash, vector) for text_hash, vector in unique.items() if text_hash not in existing]
+                if not fresh:
+                    self._conn.rollback()
+                    return
+                with open(self._vectors_path, "ab") as f:
+                    size = f.seek(0, os.SEEK_END)
+                    if size % self._row_bytes:
+                        # 丢弃中断写入留下的不完整行
+                        f.truncate(size - size % self._row_bytes)
+                    start = size // self._row_bytes
+                    f.write(np.stack([vector for _, vector in fresh]).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._conn.executemany(
+                    "INSERT INTO embeddings (model, text_hash, slot) VALUES (?, ?, ?)",
+                    [(self.model_id, text_hash, start + i) for i, (text_hash, _) in enumerate(fresh)]
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._rows = start + len(fresh)
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        返回 texts 的向量矩阵，只对库中没有的文本调用 encode_fn，并把新向量写回库中
+        Args:
+            texts: 待编码文本
+            encode_fn: 实际的编码函数
+        Returns:
+            np.ndarray: 形状为 (len(texts), dim) 的 float32 矩阵
+        """
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        vectors = self.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            encoded = np.asarray(encode_fn(missing), dtype=np.float32)
+            try:
+                self.put_many(missing, encoded)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"写入向量库失败: {e}")
+            fresh = dict(zip(missing, encoded))
+            vectors = [fresh[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return np.stack(vectors)
+
+    def stats(self) -> Dict:
+        """返回命中率与存储规模"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "model_id": self.model_id,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "vectors": self._rows,
+                "bytes": self._rows * self._row_bytes,
+            }
@@ -0,0 +1,195 @@
+"""
+@File    : kb_jobs.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/09/22 14:10
+"""
+
+"""
+知识库后台构建任务模块：上传后立即返回任务 ID，构建在后台线程中执行，
+调用方通过任务 ID 轮询进度（已编码行数、速率、剩余时间、错误）或取消任务。
+"""
+
+import os
+import time
+import uuid
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from rag_manager import ragManager, BuildCancelled
+
+# 初始化日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 同时执行的构建任务数，向量编码占满 CPU，默认串行
+KB_BUILD_WORKERS = 1
+# 最多保留多少个已结束任务的状态
+KB_JOB_HISTORY = 100
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# 任务类型：新建知识库 / 增量同步已有知识库
+BUILD = "build"
+UPSERT = "upsert"
+
+
+class KBBuildJob:
+    """
+    单个知识库构建任务的状态。
+    """
+
+    def __init__(self, file_path: str, mode: str = BUILD, cleanup_dir: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        self.file_path = file_path
+        self.cleanup_dir = cleanup_dir
+        self.status = PENDING
+        self.progress: Dict = {"rows_done": 0, "rows_total": None, "rows_per_sec": 0.0, "eta_seconds": None}
+        self.collection_name: Optional[str] = None
+        self.report: Optional[Dict] = None
+        self.message: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "mode": self.mode,
+            "file_name": os.path.basename(self.file_path),
+            "status": self.status,
+            "progress": dict(self.progress),
+            "collection_name": self.collection_name,
+            "report": self.report,
+            "message": self.message,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class KBJobManager:
+    """
+    知识库构建任务管理器：提交、查询、取消任务。
+    """
+
+    def __init__(self, max_workers: int = KB_BUILD_WORKERS, history: int = KB_JOB_HISTORY):
+        self.history = history
+        self._jobs: "OrderedDict[str, KBBuildJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kb_build")
+
+    def submit(self, file_path: str, mode: str = BUILD, cleanup_dir: Optional[str] = None) -> KBBuildJob:
+        """
+        提交构建任务
+        Args:
+            file_path: 待构建的 CSV 文件路径
+            mode: BUILD 新建知识库，UPSERT 增量同步已有知识库
+            cleanup_dir: 任务结束后删除的临时目录（上传文件所在目录）
+        Returns:
+            KBBuildJob: 新建的任务
+        """
+        job = KBBuildJob(file_path, mode, cleanup_dir)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        self._executor.submit(self._run, job)
+        logger.info(f"已提交知识库构建任务 {job.id}: {os.path.basename(file_path)}")
+        return job
+
+    def _trim(self):
+        """淘汰最早结束的任务记录，调用方需持有锁"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: KBBuildJob):
+        try:
+            if job.cancel_event.is_set():
+                raise BuildCancelled("任务在开始前已取消")
+            job.status = RUNNING
+            job.started_at = time.time()
+            if job.mode == UPSERT:
+                report = ragManager.upsert_collection(
+                    job.file_path,
+                    progress_callback=job.progress.update,
+                    cancel_event=job.cancel_event
+                )
+                job.collection_name = report["collection_name"]
+                job.report = report
+                job.message = (
+                    f"✅ 知识库 '{report['collection_name']}' 已同步：新增 {report['added']}，更新 {report['updated']}，"
+                    f"删除 {report['deleted']}，跳过 {report['skipped']}，耗时 {report['elapsed']:.1f} 秒。"
+                )
+            else:
+                collection_name, rows, elapsed = ragManager.build_collection(
+                    job.file_path,
+                    progress_callback=job.progress.update,
+                    cancel_event=job.cancel_event
+                )
+                job.collection_name = collection_name
+                job.message = f"✅ 知识库 '{collection_name}' 构建成功，包含 {rows} 个句对，耗时 {elapsed:.1f} 秒。"
+            job.status = SUCCEEDED
+        except BuildCancelled as e:
+            job.message = str(e)
+            job.status = CANCELLED
+        except ValueError as e:
+            job.error = str(e)
+            job.message = str(e)
+            job.status = FAILED
+        except Exception as e:
+            logger.error(f"知识库构建任务 {job.id} 失败: {e}")
+            job.error = str(e)
+            job.message = f"❌ 构建失败: {str(e)}"
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            if job.cleanup_dir:
+                shutil.rmtree(job.cleanup_dir, ignore_errors=True)
+            logger.info(f"知识库构建任务 {job.id} 结束，状态: {job.status}")
+
+    def get(self, job_id: str) -> Optional[KBBuildJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict]:
+        """返回全部任务状态，最新的在前"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def cancel(self, job_id: str) -> Optional[KBBuildJob]:
+        """
+        请求取消任务。运行中的任务在下一个写入批次前停止，已结束的任务不受影响。
+        """
+        job = self.get(job_id)
+        if job is not None and job.status not in FINISHED_STATES:
+            job.cancel_event.set()
+            logger.info(f"已请求取消知识库构建任务 {job_id}")
+        return job
+
+    def shutdown(self):
+        """取消全部未结束的任务并停止线程池"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if job.status not in FINISHED_STATES:
+                job.cancel_event.set()
+        self._executor.shutdown(wait=False)
+
+
+# 创建全局实例
+kbJobManager = KBJobManager()
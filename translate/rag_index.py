@@ -0,0 +1,294 @@
+"""
+@File    : rag_index.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/09/15 09:20
+"""
+
+"""
+知识库内存索引模块：为每个 collection 维护 source → target 的进程内索引，
+使关键词精确匹配变为纯字典查找，子串匹配由 Aho-Corasick 自动机一次扫描完成，
+词法检索由 source 分词后的 BM25 倒排索引完成，不再逐个关键词查询 ChromaDB 或全量读取 collection。
+"""
+
+import re
+import math
+import string
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+import jieba
+
+from utils.aho_corasick import AhoCorasick
+
+Pair = Tuple[str, str]
+
+# 只参与子串匹配的短 source（人名、术语等）的最大长度
+SUBSTRING_MAX_LEN = 10
+
+# BM25 参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 句对数不少于 BM25_DF_CUT_MIN_DOCS 时，跳过出现在超过该比例句对中的词（如“的”“the”），
+# 这类词区分度很低，倒排列表却很长
+BM25_MAX_DF_RATIO = 0.2
+BM25_DF_CUT_MIN_DOCS = 1000
+
+# 分词：ASCII 单词/数字整体作为一个词，连续中文交给 jieba
+_TOKEN_PATTERN = re.compile(r'[A-Za-z0-9]+|[\u4e00-\u9fa5]+')
+# BM25 使用只含默认词典的独立分词器：注册知识库术语不改变已建索引的分词结果，
+# 文档与查询的分词始终一致
+_bm25_tokenizer = jieba.Tokenizer()
+
+# 注册为 jieba 自定义词的术语：含中文、可夹杂字母数字、不含空白与标点的短 source
+GLOSSARY_TERM_MAX_LEN = 10
+_GLOSSARY_TERM_PATTERN = re.compile(r'[\u4e00-\u9fa5A-Za-z0-9]*[\u4e00-\u9fa5][\u4e00-\u9fa5A-Za-z0-9]*')
+
+# 仅折叠 ASCII 大小写，不改变字符串长度，也不影响中文等其他字符
+_ASCII_FOLD = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def fold_ascii(text: str) -> str:
+    """将文本中的 ASCII 大写字母转为小写"""
+    return text.translate(_ASCII_FOLD)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    BM25 分词：英文按单词（小写），中文按 jieba 精确模式，忽略标点与空白。
+    """
+    tokens = []
+    for segment in _TOKEN_PATTERN.findall(text):
+        if segment.isascii():
+            tokens.append(fold_ascii(segment))
+        else:
+            tokens.extend(word for word in _bm25_tokenizer.lcut(segment) if word.strip())
+    return tokens
+
+
+def initialize_tokenizers():
+    """预先加载 jieba 词典（默认分词器与 BM25 分词器），避免首个请求承担约 1 秒的加载时间"""
+    jieba.initialize()
+    _bm25_tokenizer.initialize()
+
+
+class JiebaGlossary:
+    """
+    将知识库的术语 source 注册为 jieba 默认分词器的自定义词，使分词结果保留完整术语。
+
+    按 collection 记录术语并引用计数：多个知识库共享的术语在最后一个知识库移除后才注销，
+    注销时恢复词典中原有的词频，不影响 jieba 自带的词。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_collection: Dict[str, Set[str]] = {}
+        self._refs: Counter = Counter()
+        # 术语 → 注册前的词频（None 表示原词典中没有该词）
+        self._original_freq: Dict[str, int] = {}
+
+    @staticmethod
+    def is_term(text: str) -> bool:
+        return 2 <= len(text) <= GLOSSARY_TERM_MAX_LEN and _GLOSSARY_TERM_PATTERN.fullmatch(text) is not None
+
+    def __contains__(self, term: str) -> bool:
+        return term in self._refs
+
+    def __len__(self) -> int:
+        return len(self._refs)
+
+    def set_collection(self, name: str, sources: Iterable[str]):
+        """用 collection 当前的 source 替换其已注册的术语"""
+        terms = {source for source in sources if self.is_term(source)}
+        with self._lock:
+            old = self._by_collection.get(name, set())
+            for term in terms - old:
+                self._acquire(term)
+            for term in old - terms:
+                self._release(term)
+            if terms:
+                self._by_collection[name] = terms
+            else:
+                self._by_collection.pop(name, None)
+
+    def drop_collection(self, name: str):
+        """注销 collection 的全部术语"""
+        with self._lock:
+            for term in self._by_collection.pop(name, ()):
+                self._release(term)
+
+    def _acquire(self, term: str):
+        self._refs[term] += 1
+        if self._refs[term] == 1:
+            self._original_freq[term] = jieba.dt.FREQ.get(term) or None
+            # 不指定词频时 jieba 会计算一个足以让该词整体切出的词频
+            jieba.add_word(term)
+
+    def _release(self, term: str):
+        self._refs[term] -= 1
+        if self._refs[term] <= 0:
+            del self._refs[term]
+            original = self._original_freq.pop(term, None)
+            if original is None:
+                jieba.del_word(term)
+            else:
+                jieba.add_word(term, freq=original)
+
+
+class CollectionIndex:
+    """
+    单个 collection 的内存索引。
+
+    - _exact: 原样 source → 句对集合
+    - _folded: ASCII 小写化的 source → 句对集合，用于大小写无关匹配
+    - _automaton: 由短 source 的折叠形式构建的 Aho-Corasick 自动机
+    - _postings: 词 → {句对编号: 词频}，source 分词后的 BM25 倒排索引
+    同一句对可能在 collection 中出现多次，用计数保证删除时索引一致。
+    """
+
+    def __init__(self, name: str, pairs: Iterable[Pair] = ()):
+        self.name = name
+        self._counts: Counter = Counter()
+        self._exact: Dict[str, Set[Pair]] = defaultdict(set)
+        self._folded: Dict[str, Set[Pair]] = defaultdict(set)
+        self._automaton = AhoCorasick()
+        # BM25：句对 → 编号，编号 → (句对, 词频, 长度)，倒排列表与总词数
+        self._doc_ids: Dict[Pair, int] = {}
+        self._docs: Dict[int, Tuple[Pair, Counter, int]] = {}
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._total_len = 0
+        self._next_doc = 0
+        self.add_pairs(pairs)
+
+    def __len__(self) -> int:
+        return sum(self._counts.values())
+
+    def pairs(self) -> List[Pair]:
+        """返回索引中的全部不重复句对"""
+        return list(self._counts)
+
+    def sources(self) -> List[str]:
+        """返回索引中的全部不重复 source"""
+        return list(self._exact)
+
+    def add_pairs(self, pairs: Iterable[Pair]):
+        """增加句对"""
+        for source, target in pairs:
+            pair = (source, target)
+            self._counts[pair] += 1
+            if self._counts[pair] == 1:
+                self._exact[source].add(pair)
+                folded = fold_ascii(source)
+                if folded not in self._folded and len(folded) <= SUBSTRING_MAX_LEN:
+                    self._automaton.add(folded)
+                self._folded[folded].add(pair)
+                self._add_doc(pair)
+
+    def remove_pairs(self, pairs: Iterable[Pair]):
+        """删除句对，计数归零时从索引中移除"""
+        for source, target in pairs:
+            pair = (source, target)
+            if self._counts[pair] <= 0:
+                continue
+            self._counts[pair] -= 1
+            if self._counts[pair] == 0:
+                del self._counts[pair]
+                self._discard(self._exact, source, pair)
+                folded = fold_ascii(source)
+                self._discard(self._folded, folded, pair)
+                if folded not in self._folded:
+                    self._automaton.remove(folded)
+                self._remove_doc(pair)
+
+    def _add_doc(self, pair: Pair):
+        """将句对的 source 分词后加入倒排索引"""
+        terms = Counter(tokenize(pair[0]))
+        doc_id = self._next_doc
+        self._next_doc += 1
+        self._doc_ids[pair] = doc_id
+        length = sum(terms.values())
+        # 保存加入时的词频，词典变化（如新增自定义词）后删除仍与加入时一致
+        self._docs[doc_id] = (pair, terms, length)
+        self._total_len += length
+        for term, tf in terms.items():
+            self._postings[term][doc_id] = tf
+
+    def _remove_doc(self, pair: Pair):
+        doc_id = self._doc_ids.pop(pair, None)
+        if doc_id is None:
+            return
+        _, terms, length = self._docs.pop(doc_id)
+        self._total_len -= length
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self._postings[term]
+
+    @staticmethod
+    def _discard(mapping: Dict[str, Set[Pair]], key: str, pair: Pair):
+        bucket = mapping.get(key)
+        if bucket is not None:
+            bucket.discard(pair)
+            if not bucket:
+                del mapping[key]
+
+    def lookup_exact(self, keyword: str) -> List[Pair]:
+        """
+        精确匹配关键词：ASCII 关键词大小写无关，其他关键词要求完全一致。
+        """
+        if keyword.isascii():
+            return list(self._folded.get(fold_ascii(keyword), ()))
+        return list(self._exact.get(keyword, ()))
+
+    def search_bm25(self, query: str, k: int, min_coverage: float = 0.0) -> List[Tuple[Pair, float]]:
+        """
+        BM25 词法检索，只遍历与查询共享词的句对，耗时与知识库大小无关（低区分度的高频词除外）。
+
+        Args:
+            query (str): 查询文本
+            k (int): 返回的最大结果数
+            min_coverage (float): source 的不同词中至少有多大比例出现在查询里，
+                过滤只因个别常见词重合而命中的句对
+
+        Returns:
+            List[Tuple[Pair, float]]: (句对, BM25 分数)，按分数降序
+        """
+        doc_count = len(self._docs)
+        if doc_count == 0 or k <= 0:
+            return []
+        avg_len = self._total_len / doc_count
+        max_df = doc_count * BM25_MAX_DF_RATIO if doc_count >= BM25_DF_CUT_MIN_DOCS else doc_count
+
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, int] = defaultdict(int)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if not posting or len(posting) > max_df:
+                continue
+            df = len(posting)
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for doc_id, tf in posting.items():
+                length = self._docs[doc_id][2]
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len))
+                matched[doc_id] += 1
+
+        ranked = []
+        for doc_id, score in scores.items():
+            pair, terms, _ = self._docs[doc_id]
+            if matched[doc_id] >= min_coverage * len(terms):
+                ranked.append((pair, score))
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked[:k]
+
+    def find_substrings(self, query: str) -> List[Pair]:
+        """
+        找出 source 作为子串出现在 query 中的全部短句对（ASCII 大小写无关），
+        耗时与 query 长度和匹配数成正比，与知识库大小无关。
+        """
+        matches = []
+        for folded in self._automaton.find_all(fold_ascii(query)):
+            matches.extend(self._folded.get(folded, ()))
+        return matches
@@ -15,11 +15,26 @@ os.environ['CHROMA_TELEMETRY_ENABLED'] = 'false'  # 关闭遥测
 import logging
 import pandas as pd
 import re
-from typing import List, Dict, Set
+import time
+import json
+import hashlib
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from concurrent.futures import Future
+from typing import List, Dict, Set, Callable, Optional, Union
+import numpy as np
 import jieba
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+
+from utils.config import Config
+
+from rag_index import CollectionIndex, JiebaGlossary, initialize_tokenizers
+from embedding_cache import EmbeddingLRU, EmbeddingStore
+from embedding_backend import load_embedding_model, backend_id, TORCH
+from vector_store import MemmapVectorStore
+from utils.text import normalize_text
 
 # 初始化日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -32,11 +47,180 @@ os.makedirs(CHROMA_DB_DIR, exist_ok=True)
 # 模型路径
 LOCAL_MODEL_PATH = "./models/embeddings"
 
+
+class BuildCancelled(Exception):
+    """知识库构建被调用方取消"""
+
+
+class EmbeddingBatcher:
+    """
+    查询向量的跨请求微批调度器。
+
+    检索在线程池中并发执行，各线程提交的待编码文本先进入等待队列，
+    后台线程等待最多 max_wait_ms 毫秒或凑满 max_batch_size 条后，
+    以一次 encode 调用完成整批编码，再把各自的向量交还给对应的调用方。
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], max_batch_size: int = 64,
+                 max_wait_ms: float = 5):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+
+        self._pending = deque()
+        self._pending_texts = 0
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._worker: Optional[threading.Thread] = None
+        self._batches = 0
+        self._texts = 0
+        self._requests = 0
+
+    def _ensure_worker(self):
+        # 调用方需持有 _cond
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._worker.start()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        提交一组文本，阻塞直到所在批次编码完成
+        Args:
+            texts: 待编码文本
+        Returns:
+            np.ndarray: 形状为 (len(texts), dim) 的 float32 矩阵
+        """
+        future = Future()
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("EmbeddingBatcher 已停止")
+            self._ensure_worker()
+            self._pending.append((texts, future))
+            self._pending_texts += len(texts)
+            self._cond.notify_all()
+        return future.result()
+
+    def _take_batch(self) -> List[tuple]:
+        """等待并取出一个批次，调度器停止时返回空列表"""
+        with self._cond:
+            while not self._pending and not self._stopped:
+                self._cond.wait()
+            if self._stopped:
+                return []
+
+            # 从取到第一条文本开始计时，凑满批次或超时后立即执行
+            deadline = time.monotonic() + self.max_wait
+            while self._pending_texts < self.max_batch_size and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            # 同一调用方的文本不拆分到不同批次，至少取一个调用方
+            batch, count = [], 0
+            while self._pending and (not batch or count + len(self._pending[0][0]) <= self.max_batch_size):
+                texts, future = self._pending.popleft()
+                self._pending_texts -= len(texts)
+                batch.append((texts, future))
+                count += len(texts)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if self._stopped:
+                    return
+                continue
+
+            # 不同请求中的相同文本只编码一次
+            unique = list(dict.fromkeys(text for texts, _ in batch for text in texts))
+            self._batches += 1
+            self._texts += len(unique)
+            self._requests += len(batch)
+            try:
+                encoded = np.asarray(self.encode_fn(unique), dtype=np.float32)
+                positions = {text: i for i, text in enumerate(unique)}
+                for texts, future in batch:
+                    future.set_result(encoded[[positions[text] for text in texts]])
+            except Exception as e:
+                logger.error(f"查询向量批量编码失败: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def stats(self) -> Dict:
+        """返回批次数、平均批大小与当前等待数"""
+        with self._cond:
+            pending = self._pending_texts
+        return {
+            "batches": self._batches,
+            "requests": self._requests,
+            "texts": self._texts,
+            "avg_batch_size": round(self._texts / self._batches, 2) if self._batches else 0.0,
+            "pending": pending,
+        }
+
+    def shutdown(self):
+        """停止调度器，未处理的请求以异常结束"""
+        with self._cond:
+            self._stopped = True
+            pending = list(self._pending)
+            self._pending.clear()
+            self._pending_texts = 0
+            self._cond.notify_all()
+        for _, future in pending:
+            future.set_exception(RuntimeError("EmbeddingBatcher 已停止"))
+
+
 class RAGManager:
     def __init__(self):
         self.chroma_client = None
         self.embedding_model = None
+        # 实际使用的向量模型后端，量化后端加载失败时回退为 torch
+        self.embedding_backend = TORCH
+        # 知识库版本戳缓存，为 None 时表示需要重新计算
+        self._kb_version = None
+        # 知识库变更监听器（如翻译结果缓存的失效回调）
+        self._change_listeners: List[Callable[[], None]] = []
+        # 每个 collection 的内存索引（source → target），构建或首次打开时加载
+        self._indexes: Dict[str, CollectionIndex] = {}
+        self._index_lock = threading.Lock()
+        # 已加载知识库的术语 source 注册为 jieba 自定义词，随内存索引一起更新
+        self._glossary = JiebaGlossary()
+        # collection 注册表：名称 → 句柄、名称 → (条目数, 构建时间) 签名，为 None 时需要重新加载
+        self._handles: Dict = None
+        self._signatures: Dict[str, tuple] = None
+        self._registry_stamp = None
+        self._registry_checked_at = 0.0
+        self._registry_lock = threading.RLock()
+        # 本进程正在写入的 collection（名称 → 写入者数），写入完成并登记前不参与注册表重新加载
+        self._writing: Counter = Counter()
+        # 查询向量缓存：规范化查询文本 → 向量，与知识库内容无关，无需随知识库失效
+        self._query_cache = EmbeddingLRU(Config.EMBEDDING_CACHE_MAX_BYTES)
         self._load_models()
+        self.embedding_model_id = self._embedding_model_id()
+        # 启动时加载 jieba 词典，首个请求无需等待
+        initialize_tokenizers()
+        self._embedding_store = EmbeddingStore(
+            Config.EMBEDDING_STORE_DIR,
+            self.embedding_model_id,
+            self.embedding_model.get_sentence_embedding_dimension()
+        ) if Config.EMBEDDING_STORE_ENABLED else None
+        # 语义检索后端，为 None 时直接查询 ChromaDB
+        self._vector_store = MemmapVectorStore(
+            Config.VECTOR_STORE_DIR,
+            dtype=Config.VECTOR_STORE_DTYPE,
+            compression=Config.VECTOR_STORE_COMPRESSION,
+            pq_subvectors=Config.VECTOR_STORE_PQ_SUBVECTORS,
+            rerank_factor=Config.VECTOR_STORE_RERANK_FACTOR
+        ) if Config.VECTOR_STORE_BACKEND == "memmap" else None
+        # 并发检索的查询向量合并为批次编码
+        self._embed_batcher = EmbeddingBatcher(
+            self.embedding_model.encode,
+            max_batch_size=Config.EMBED_MAX_BATCH_SIZE,
+            max_wait_ms=Config.EMBED_BATCH_WAIT_MS
+        ) if Config.EMBED_BATCH_ENABLED else None
 
     def _load_models(self):
         # 初始化组件
@@ -48,30 +232,411 @@ class RAGManager:
         if not os.path.exists(LOCAL_MODEL_PATH):
             raise FileNotFoundError(f"模型未找到: {LOCAL_MODEL_PATH}，请先运行download_models.py下载模型。")
 
-        # 加载本地模型（离线）
-        self.embedding_model = SentenceTransformer(
-            LOCAL_MODEL_PATH,
-            trust_remote_code=True
+        # 加载本地模型（离线），按配置选择 PyTorch 或 int8 量化 ONNX Runtime 后端
+        backend = Config.EMBEDDING_BACKEND
+        try:
+            self.embedding_model = load_embedding_model(
+                LOCAL_MODEL_PATH,
+                backend=backend,
+                quantization=Config.EMBEDDING_ONNX_QUANTIZATION,
+                threads=Config.EMBEDDING_ONNX_THREADS
+            )
+        except ImportError as e:
+            logger.warning(f"向量模型后端 {backend} 依赖缺失（{e}），回退为 {TORCH}")
+            backend = TORCH
+            self.embedding_model = load_embedding_model(LOCAL_MODEL_PATH, backend=TORCH)
+        self.embedding_backend = backend
+
+    def _embedding_model_id(self) -> str:
+        """
+        向量模型标识：由推理后端与模型目录中的文件名、大小计算，替换模型或后端后不会复用旧向量。
+        导出的 onnx/ 子目录不参与计算。
+        """
+        files = []
+        for root, dirs, names in os.walk(LOCAL_MODEL_PATH):
+            if root == LOCAL_MODEL_PATH and "onnx" in dirs:
+                dirs.remove("onnx")
+            for name in names:
+                path = os.path.join(root, name)
+                files.append([os.path.relpath(path, LOCAL_MODEL_PATH), os.path.getsize(path)])
+        digest = hashlib.sha1(json.dumps(sorted(files)).encode("utf-8")).hexdigest()[:16]
+        backend = backend_id(self.embedding_backend, Config.EMBEDDING_ONNX_QUANTIZATION)
+        return f"sentence-transformers:{os.path.basename(os.path.normpath(LOCAL_MODEL_PATH))}:{backend}:{digest}"
+
+    def _encode_sources(self, sentences: List[str]) -> np.ndarray:
+        """
+        为知识库句对编码，优先复用持久化向量库中已有的向量。
+        """
+        def encode(texts: List[str]) -> np.ndarray:
+            return self.embedding_model.encode(texts, batch_size=Config.KB_ENCODE_BATCH_SIZE)
+
+        if self._embedding_store is None:
+            return np.asarray(encode(sentences), dtype=np.float32)
+        return self._embedding_store.encode(sentences, encode)
+
+    def add_change_listener(self, callback: Callable[[], None]):
+        """
+        注册知识库变更回调，在构建或删除知识库后被调用。
+        """
+        self._change_listeners.append(callback)
+
+    def _notify_kb_changed(self):
+        """
+        知识库发生变化：重置版本戳并通知所有监听器。
+        """
+        self._kb_version = None
+        for callback in self._change_listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"知识库变更回调执行失败: {e}")
+
+    def _fs_stamp(self) -> tuple:
+        """
+        ChromaDB SQLite 文件（含 WAL）的修改时间与大小，用于发现其他进程的写入。
+        """
+        stamp = []
+        for suffix in ("", "-wal"):
+            try:
+                st = os.stat(os.path.join(CHROMA_DB_DIR, "chroma.sqlite3" + suffix))
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    @staticmethod
+    def _signature(collection) -> tuple:
+        return collection.count(), (collection.metadata or {}).get("built_at")
+
+    def _load_registry(self) -> bool:
+        """
+        从 ChromaDB 重新读取 collection 列表、句柄与条目数。
+        签名发生变化的 collection 会丢弃其内存索引，之后按需重新加载。
+        调用方需持有 _registry_lock。
+        Returns:
+            bool: 与上次加载相比是否有知识库发生变化
+        """
+        handles, signatures = {}, {}
+        previous = self._signatures
+        for name in self.chroma_client.list_collections():
+            if name in self._writing:
+                # 本进程正在写入：沿用写入前的登记（新建中的知识库不出现），写入完成后由 _register_collection 更新
+                if previous is not None and name in previous:
+                    signatures[name] = previous[name]
+                    if name in self._handles:
+                        handles[name] = self._handles[name]
+                continue
+            try:
+                collection = self.chroma_client.get_collection(name=name)
+                handles[name] = collection
+                signatures[name] = self._signature(collection)
+            except Exception as e:
+                # 如果某个 collection 无法加载（可能已损坏），仍将其记录
+                signatures[name] = None
+                logger.warning(f"无法加载 collection '{name}': {e}")
+
+        with self._index_lock:
+            for name in list(self._indexes):
+                if name not in handles or (previous and name in previous and previous[name] != signatures[name]):
+                    self._drop_index(name)
+
+        self._handles, self._signatures = handles, signatures
+        self._registry_stamp = self._fs_stamp()
+        self._registry_checked_at = time.time()
+        self._kb_version = None
+        logger.info(f"已加载 collection 注册表，共 {len(signatures)} 个知识库")
+        return previous is not None and previous != signatures
+
+    def _ensure_registry(self):
+        """
+        确保注册表可用。稳态下不访问 ChromaDB，只按间隔检查一次文件戳，
+        文件被其他进程修改时才重新加载。
+        """
+        if self._handles is not None:
+            now = time.time()
+            if Config.KB_REGISTRY_WATCH_INTERVAL <= 0 or now - self._registry_checked_at < Config.KB_REGISTRY_WATCH_INTERVAL:
+                return
+            self._registry_checked_at = now
+            if self._fs_stamp() == self._registry_stamp:
+                return
+            logger.info("检测到 ChromaDB 文件变化，刷新 collection 注册表")
+
+        with self._registry_lock:
+            changed = self._load_registry()
+        if changed:
+            self._notify_kb_changed()
+
+    @contextmanager
+    def _writing_collection(self, name: str):
+        """
+        标记本进程正在写入 collection：期间文件戳的变化来自本进程，注册表重新加载时跳过该 collection，
+        退出时刷新文件戳。只有其他进程的写入才会触发重新加载。
+        """
+        with self._registry_lock:
+            self._writing[name] += 1
+        try:
+            yield
+        finally:
+            with self._registry_lock:
+                self._writing[name] -= 1
+                if self._writing[name] <= 0:
+                    del self._writing[name]
+            self._touch_registry_stamp()
+
+    def _touch_registry_stamp(self):
+        """本进程写入一批数据后刷新文件戳，避免把自己的写入当作其他进程的修改"""
+        with self._registry_lock:
+            if self._handles is not None:
+                self._registry_stamp = self._fs_stamp()
+
+    def _register_collection(self, collection):
+        """
+        本进程创建或修改 collection 后更新注册表中的对应条目，无需整体重新加载。
+        """
+        with self._registry_lock:
+            if self._handles is None:
+                self._load_registry()
+            # 重新加载会跳过本进程正在写入的 collection，需显式登记
+            self._handles[collection.name] = collection
+            self._signatures[collection.name] = self._signature(collection)
+            self._registry_stamp = self._fs_stamp()
+        self._notify_kb_changed()
+
+    def _unregister_collections(self, names: List[str]):
+        """
+        本进程删除 collection 后从注册表和内存索引中移除。
+        """
+        with self._registry_lock:
+            if self._handles is not None:
+                for name in names:
+                    self._handles.pop(name, None)
+                    self._signatures.pop(name, None)
+                self._registry_stamp = self._fs_stamp()
+        with self._index_lock:
+            for name in names:
+                self._drop_index(name)
+        self._notify_kb_changed()
+
+    def _get_collections(self, collection_name: Union[str, List[str]] = None) -> List:
+        """
+        从注册表获取 collection 句柄，可指定单个名称或名称列表，指定名称不存在时抛出 ValueError。
+        """
+        self._ensure_registry()
+        handles = self._handles
+        if collection_name:
+            names = [collection_name] if isinstance(collection_name, str) else list(dict.fromkeys(collection_name))
+            for name in names:
+                if name not in handles:
+                    raise ValueError(f"Collection {name} does not exist.")
+            return [handles[name] for name in names]
+        return list(handles.values())
+
+    def get_kb_version(self) -> str:
+        """
+        返回当前全部知识库的版本戳。
+        由每个 collection 的名称、条目数和构建时间计算得出，
+        任何知识库的增删或重建都会改变该值。
+        """
+        self._ensure_registry()
+        if self._kb_version is None:
+            state = [[name, *(signature or (None, None))] for name, signature in sorted(self._signatures.items())]
+            raw = json.dumps(state, ensure_ascii=False)
+            self._kb_version = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+        return self._kb_version
+
+    def _get_index(self, collection) -> CollectionIndex:
+        """
+        获取 collection 的内存索引，首次访问时从 ChromaDB 一次性读取全部句对。
+        """
+        index = self._indexes.get(collection.name)
+        if index is None:
+            with self._index_lock:
+                index = self._indexes.get(collection.name)
+                if index is None:
+                    items = collection.get(include=["metadatas"])
+                    index = CollectionIndex(
+                        collection.name,
+                        ((meta['source'], meta['target']) for meta in items['metadatas'])
+                    )
+                    self._set_index(collection.name, index)
+                    logger.info(f"已加载知识库 '{collection.name}' 的内存索引，共 {len(index)} 个句对")
+                    self._check_embedding_model(collection)
+        return index
+
+    def _check_embedding_model(self, collection):
+        """
+        知识库中的向量与当前查询向量由不同模型或推理后端生成时给出警告：
+        切换 EMBEDDING_BACKEND 不会重新编码已有知识库，语义检索的距离会产生偏差，需重新构建知识库。
+        未记录模型的知识库构建于记录之前，按 torch 后端生成处理。
+        """
+        built_with = (collection.metadata or {}).get("embedding_model")
+        if built_with is None:
+            mismatch = self.embedding_backend != TORCH
+        else:
+            mismatch = built_with != self.embedding_model_id
+        if mismatch:
+            logger.warning(
+                f"知识库 '{collection.name}' 的向量由 {built_with or TORCH} 生成，"
+                f"与当前向量模型 {self.embedding_model_id} 不一致，语义检索结果可能变差，请删除后重新构建该知识库"
+            )
+
+    def warm_up(self):
+        """
+        启动时预先加载全部知识库的注册表与内存索引（同时注册术语到 jieba），
+        memmap 后端下同时准备向量视图，首个请求无需承担这些加载开销。
+        """
+        started_at = time.perf_counter()
+        collections = self._get_collections()
+        for collection in collections:
+            try:
+                self._get_index(collection)
+                if self._vector_store is not None:
+                    self._get_vector_collection(collection)
+            except Exception as e:
+                logger.warning(f"预加载知识库 '{collection.name}' 失败: {e}")
+        logger.info(
+            f"已预加载 {len(collections)} 个知识库，注册术语 {len(self._glossary)} 个，"
+            f"耗时 {time.perf_counter() - started_at:.1f} 秒"
+        )
+
+    def _set_index(self, name: str, index: CollectionIndex):
+        """设置 collection 的内存索引并同步注册其术语，调用方需持有 _index_lock"""
+        self._indexes[name] = index
+        self._glossary.set_collection(name, index.sources())
+
+    def _drop_index(self, name: str):
+        """移除 collection 的内存索引并注销其术语，调用方需持有 _index_lock"""
+        self._indexes.pop(name, None)
+        self._glossary.drop_collection(name)
+
+    def _iter_embeddings(self, collection):
+        """分页读取 collection 中的全部向量与元数据"""
+        page_size = self._add_batch_size()
+        offset = 0
+        while True:
+            page = collection.get(include=["embeddings", "metadatas"], limit=page_size, offset=offset)
+            if len(page['ids']):
+                yield np.asarray(page['embeddings'], dtype=np.float32), page['metadatas']
+            if len(page['ids']) < page_size:
+                return
+            offset += page_size
+
+    def _get_vector_collection(self, collection):
+        """
+        获取 collection 在内存映射向量库中的视图。
+        尚未导出、签名已过期（本进程或其他进程修改过知识库）或版本无法打开时从 ChromaDB 重新导出，无需重新编码。
+        """
+        signature = self._signatures.get(collection.name)
+        return self._vector_store.get_or_write(
+            collection.name,
+            lambda: self._iter_embeddings(collection),
+            self.embedding_model.get_sentence_embedding_dimension(),
+            signature=signature
         )
 
+    def _sync_vector_store(self, collection):
+        """
+        知识库写入后立即导出到内存映射向量库，避免首次检索时承担导出开销。失败时下次检索再重试。
+        """
+        if self._vector_store is None:
+            return
+        try:
+            self._get_vector_collection(collection)
+        except Exception as e:
+            logger.warning(f"导出知识库 '{collection.name}' 到内存映射向量库失败: {e}")
+
+    def _semantic_search(self, collections: List, query_embeddings: np.ndarray,
+                         n_results: int) -> List[List[tuple]]:
+        """
+        在多个 collection 上做合并语义检索，返回全局 top-k 并标注结果所属的 collection。
+        memmap 后端一次扫描全部知识库；chroma 后端逐个查询后合并。
+        Returns:
+            List[List[tuple]]: 每条查询的 (平方 L2 距离, collection 名称, 元数据) 列表，按距离升序
+        """
+        if self._vector_store is not None:
+            views = {}
+            for coll in collections:
+                try:
+                    views[coll.name] = self._get_vector_collection(coll)
+                except Exception as e:
+                    logger.warning(f"打开知识库 '{coll.name}' 的内存映射向量失败: {e}")
+            return self._vector_store.search(views, query_embeddings, n_results)
+
+        merged = [[] for _ in range(len(query_embeddings))]
+        for coll in collections:
+            try:
+                semantic_res = coll.query(
+                    query_embeddings=query_embeddings.tolist(),
+                    n_results=n_results,
+                    include=["metadatas", "distances"]
+                )
+                for idx, (distances, metadatas) in enumerate(zip(semantic_res['distances'], semantic_res['metadatas'])):
+                    merged[idx].extend((distance, coll.name, metadata) for distance, metadata in zip(distances, metadatas))
+            except Exception as e:
+                logger.debug(f"语义检索出错: {e}")
+        return [sorted(hits, key=lambda hit: hit[0])[:n_results] for hits in merged]
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        将查询编码为向量，优先使用 LRU 缓存，未命中的查询合并为一次 encode 调用。
+        Args:
+            queries: 查询文本列表
+        Returns:
+            np.ndarray: 形状为 (len(queries), dim) 的 float32 矩阵
+        """
+        keys = [normalize_text(query) for query in queries]
+        vectors = [self._query_cache.get(key) for key in keys]
+
+        # 同一批次中重复的查询只编码一次，并与其他并发请求的查询合并编码
+        missing = list(dict.fromkeys(key for key, vector in zip(keys, vectors) if vector is None))
+        if missing:
+            if self._embed_batcher is not None:
+                encoded = self._embed_batcher.encode(missing)
+            else:
+                encoded = np.asarray(self.embedding_model.encode(missing), dtype=np.float32)
+            fresh = dict(zip(missing, encoded))
+            for key, vector in fresh.items():
+                self._query_cache.put(key, vector)
+            vectors = [fresh[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+
+        return np.stack(vectors).astype(np.float32, copy=False)
+
+    def stats(self) -> Dict:
+        """
+        返回 RAG 模块的运行指标，用于监控。
+        """
+        return {
+            "query_embedding_cache": self._query_cache.stats(),
+            "query_embedding_batcher": self._embed_batcher.stats() if self._embed_batcher is not None else None,
+            "embedding_store": self._embedding_store.stats() if self._embedding_store is not None else None,
+            "vector_store": self._vector_store.stats() if self._vector_store is not None else None,
+            "glossary_terms": len(self._glossary),
+        }
+
+    def shutdown(self):
+        """
+        释放后台资源（查询向量批处理线程）。
+        """
+        if self._embed_batcher is not None:
+            self._embed_batcher.shutdown()
+
     def get_collections_list(self) -> List[Dict]:
         """
         从 ChromaDB 获取所有 collection，返回可用于 Gradio Dataframe 的列表。
         """
         try:
-            collection_names = self.chroma_client.list_collections()
+            self._ensure_registry()
             kb_list = []
 
-            for name in collection_names:
-                try:
-                    collection = self.chroma_client.get_collection(name=name)
+            for name, signature in self._signatures.items():
+                if signature is not None:
                     kb_list.append({
                         "Selected": False,
-                        "Name": collection.name,
+                        "Name": name,
                         "Status": "Loaded",
-                        "Count": collection.count()
+                        "Count": signature[0]
                     })
-                except Exception as e:
+                else:
                     # 如果某个 collection 无法加载（可能已损坏），仍将其列出
                     kb_list.append({
                         "Selected": False,
@@ -79,7 +644,6 @@ class RAGManager:
                         "Status": "Error",
                         "Count": "N/A"
                     })
-                    logger.warning(f"无法加载 collection '{name}': {e}")
 
             logger.info(f"从 ChromaDB 加载了 {len(kb_list)} 个知识库")
             return kb_list
@@ -87,63 +651,359 @@ class RAGManager:
             logger.error(f"获取知识库列表失败: {e}")
             return []
 
-    def build_knowledge_base(self, file_path: str, current_kbs: List[Dict] = None) -> tuple:
+    @staticmethod
+    def _count_csv_rows(file_path: str) -> int:
         """
-        核心函数：将上传的文件构建为 ChromaDB collection。
+        按换行符估算 CSV 数据行数（不含表头），用于计算进度与剩余时间。
+        字段内含换行时只是估算值。
+        """
+        lines = 0
+        last = b"\n"
+        with open(file_path, "rb") as f:
+            while True:
+                block = f.read(1024 * 1024)
+                if not block:
+                    break
+                lines += block.count(b"\n")
+                last = block[-1:]
+        if last != b"\n":
+            lines += 1
+        return max(0, lines - 1)
+
+    def _add_batch_size(self) -> int:
+        """单次 collection.add 的最大条目数，不超过 ChromaDB 允许的上限"""
+        try:
+            return min(Config.KB_CHROMA_ADD_BATCH_SIZE, self.chroma_client.get_max_batch_size())
+        except Exception:
+            return Config.KB_CHROMA_ADD_BATCH_SIZE
+
+    @staticmethod
+    def _pair_id(source: str, target: str) -> str:
+        """句对的内容哈希 ID，相同的 (source, target) 总是得到相同的 ID"""
+        digest = hashlib.sha1(json.dumps([source, target], ensure_ascii=False).encode("utf-8")).hexdigest()
+        return f"pair_{digest}"
+
+    @staticmethod
+    def _check_csv(file_path: str) -> str:
+        """
+        检查 CSV 表头并返回对应的 collection 名称。
+        Raises:
+            ValueError: 文件缺少必要列
+        """
+        columns = pd.read_csv(file_path, nrows=0).columns
+        required_columns = {'source', 'target'}
+        if not required_columns.issubset(columns):
+            raise ValueError(f"文件缺少必要列，需要 {required_columns}，但只有 {list(columns)}")
+        base_name = os.path.splitext(os.path.basename(file_path))[0]
+        return f"kb_{base_name}"
+
+    def _ingest_csv(
+            self,
+            collection,
+            file_path: str,
+            existing_ids,
+            added: Dict[str, tuple],
+            progress_callback: Callable[[Dict], None] = None,
+            cancel_event: threading.Event = None
+    ) -> tuple:
+        """
+        分块读取 CSV，跳过文件内重复的句对和 existing_ids 中已有的句对，
+        其余按 Config.KB_ENCODE_BATCH_SIZE 编码、按 ChromaDB 批量上限写入 collection。
+        峰值内存与文件大小无关（不计内容 ID 集合）。
         Args:
-            file_path (str): 上传文件的临时路径
+            existing_ids: collection 中已有句对的内容 ID 集合
+            added: 输出参数，写入成功的句对 ID → (source, target)，失败时调用方据此回滚
         Returns:
-            tuple: (updated_list, status_message)
+            tuple: (文件中出现的全部内容 ID 集合, 读取的行数)
         """
-        try:
-            # 1. 读取 CSV 文件
-            df = pd.read_csv(file_path)
-            required_columns = {'source', 'target'}
-            if not required_columns.issubset(df.columns):
-                msg = f"文件缺少必要列，需要 {required_columns}，但只有 {list(df.columns)}"
-                logger.error(msg)
-                return current_kbs, msg
-
-            sentences = df['source'].astype(str).tolist()
-            translations = df['target'].astype(str).tolist()
-            ids = [f"pair_{i}" for i in range(len(sentences))]
-
-            # 2. 提取 collection 名称
-            base_name = os.path.splitext(os.path.basename(file_path))[0]
-            collection_name = f"kb_{base_name}"
-
-            # 3. 检查是否已存在
-            collection_names = self.chroma_client.list_collections()
-            if collection_name in collection_names:
-                msg = f"知识库 '{collection_name}' 已存在，请上传其他文件。"
-                logger.warning(msg)
-                return current_kbs, msg
-
-            # 4. 创建 collection 并添加数据
-            collection = self.chroma_client.create_collection(name=collection_name)
-
-            # 生成嵌入
-            embeddings = self.embedding_model.encode(sentences).tolist()
-
-            # 添加到数据库
-            collection.add(
-                embeddings=embeddings,
-                metadatas=[{"source": s, "target": t} for s, t in zip(sentences, translations)],
-                documents=sentences,
-                ids=ids
+        add_batch_size = self._add_batch_size()
+        rows_total = self._count_csv_rows(file_path)
+        rows_done = 0
+        seen = set()
+        started_at = time.perf_counter()
+
+        for chunk in pd.read_csv(file_path, usecols=['source', 'target'], chunksize=Config.KB_CSV_CHUNK_ROWS):
+            pending = []
+            for source, target in zip(chunk['source'].astype(str), chunk['target'].astype(str)):
+                pair_id = self._pair_id(source, target)
+                if pair_id in seen:
+                    continue
+                seen.add(pair_id)
+                if pair_id not in existing_ids:
+                    pending.append((pair_id, source, target))
+
+            for start in range(0, len(pending), add_batch_size):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise BuildCancelled(f"知识库 '{collection.name}' 构建已取消")
+                batch = pending[start:start + add_batch_size]
+                batch_sources = [source for _, source, _ in batch]
+                # 生成嵌入
+                embeddings = self._encode_sources(batch_sources).tolist()
+                # 添加到数据库
+                collection.add(
+                    embeddings=embeddings,
+                    metadatas=[{"source": source, "target": target} for _, source, target in batch],
+                    documents=batch_sources,
+                    ids=[pair_id for pair_id, _, _ in batch]
+                )
+                added.update((pair_id, (source, target)) for pair_id, source, target in batch)
+                self._touch_registry_stamp()
+
+            rows_done += len(chunk)
+            rows_total = max(rows_total, rows_done)
+            elapsed = time.perf_counter() - started_at
+            rate = rows_done / elapsed if elapsed > 0 else 0.0
+            eta = (rows_total - rows_done) / rate if rate > 0 else None
+            logger.info(
+                f"知识库 '{collection.name}' 构建进度: {rows_done}/{rows_total} 行，"
+                f"{rate:.1f} 行/秒，预计剩余 {eta if eta is None else round(eta, 1)} 秒"
             )
+            if progress_callback is not None:
+                progress_callback({
+                    "rows_done": rows_done,
+                    "rows_total": rows_total,
+                    "rows_per_sec": round(rate, 1),
+                    "eta_seconds": round(eta, 1) if eta is not None else None,
+                })
+        return seen, rows_done
+
+    def _delete_ids(self, collection, ids: List[str]):
+        """按 ChromaDB 批量上限分批删除"""
+        batch_size = self._add_batch_size()
+        for start in range(0, len(ids), batch_size):
+            collection.delete(ids=ids[start:start + batch_size])
+            self._touch_registry_stamp()
+
+    def _snapshot_ids(self, collection, ids: List[str]) -> Dict:
+        """按批读取指定条目的向量、元数据与文档，供删除失败时恢复"""
+        snapshot = {"ids": [], "embeddings": [], "metadatas": [], "documents": []}
+        batch_size = self._add_batch_size()
+        for start in range(0, len(ids), batch_size):
+            page = collection.get(ids=ids[start:start + batch_size],
+                                  include=["embeddings", "metadatas", "documents"])
+            for field in snapshot:
+                snapshot[field].extend(page[field])
+        return snapshot
+
+    def _restore_snapshot(self, collection, snapshot: Dict):
+        """将 _snapshot_ids 保存的条目写回 collection，已存在的条目原样覆盖"""
+        batch_size = self._add_batch_size()
+        for start in range(0, len(snapshot["ids"]), batch_size):
+            collection.upsert(**{field: values[start:start + batch_size] for field, values in snapshot.items()})
+            self._touch_registry_stamp()
+
+    def _load_stored_pairs(self, collection) -> Dict[str, tuple]:
+        """
+        分页读取 collection 中的全部句对。
+        Returns:
+            Dict: 内容 ID → ((source, target), 实际存储的 ID 列表)；
+                  旧版按位置编号的 ID 也会按内容归并
+        """
+        stored = {}
+        page_size = self._add_batch_size()
+        offset = 0
+        while True:
+            page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            for stored_id, meta in zip(page['ids'], page['metadatas']):
+                pair = (meta['source'], meta['target'])
+                entry = stored.setdefault(self._pair_id(*pair), (pair, []))
+                entry[1].append(stored_id)
+            if len(page['ids']) < page_size:
+                return stored
+            offset += page_size
+
+    def build_collection(
+            self,
+            file_path: str,
+            progress_callback: Callable[[Dict], None] = None,
+            cancel_event: threading.Event = None
+    ) -> tuple:
+        """
+        将 CSV 文件构建为新的 ChromaDB collection，句对以内容哈希为 ID，重复行只保留一条。
+        失败或取消时删除写入了一半的 collection。
+        Args:
+            file_path (str): CSV 文件路径，文件名决定 collection 名称
+            progress_callback: 每处理一个分块后以进度字典调用
+                (rows_done, rows_total, rows_per_sec, eta_seconds)
+            cancel_event: 被置位时在下一个写入批次前停止构建
+        Returns:
+            tuple: (collection_name, 句对数量, 耗时秒数)
+        Raises:
+            ValueError: 文件缺少必要列或知识库已存在
+            BuildCancelled: 构建被取消
+        """
+        started_at = time.perf_counter()
+        collection_name = self._check_csv(file_path)
+
+        self._ensure_registry()
+        if collection_name in self._signatures or collection_name in self._writing:
+            raise ValueError(f"知识库 '{collection_name}' 已存在，请上传其他文件。")
+
+        with self._writing_collection(collection_name):
+            collection = self.chroma_client.create_collection(
+                name=collection_name,
+                # 记录生成知识库向量的模型，切换推理后端后可以发现新旧向量不一致
+                metadata={"built_at": time.time(), "embedding_model": self.embedding_model_id}
+            )
+            self._touch_registry_stamp()
+            added = {}
+            try:
+                self._ingest_csv(collection, file_path, (), added, progress_callback, cancel_event)
+            except BaseException:
+                # 删除写入了一半的 collection，避免留下不完整的知识库
+                try:
+                    self.chroma_client.delete_collection(name=collection_name)
+                except Exception as cleanup_error:
+                    logger.warning(f"清理未完成的知识库 '{collection_name}' 失败: {cleanup_error}")
+                raise
+
+            with self._index_lock:
+                self._set_index(collection_name, CollectionIndex(collection_name, added.values()))
+            self._register_collection(collection)
+        self._sync_vector_store(collection)
+        return collection_name, len(added), time.perf_counter() - started_at
+
+    def upsert_collection(
+            self,
+            file_path: str,
+            progress_callback: Callable[[Dict], None] = None,
+            cancel_event: threading.Event = None
+    ) -> Dict:
+        """
+        用 CSV 文件增量同步知识库：只编码写入新增或修改的句对，删除文件中已不存在的句对。
+        知识库不存在时等同于 build_collection。
+        全部新增写入成功后才删除旧句对，删除前保存其快照；
+        失败或取消时回滚本次写入的句对并恢复已删除的旧句对，知识库保持原状。
+        Args:
+            file_path (str): CSV 文件路径，文件名决定 collection 名称
+            progress_callback: 进度回调，见 build_collection
+            cancel_event: 被置位时在下一个写入批次前停止
+        Returns:
+            Dict: collection_name、added、updated、deleted、skipped 计数与耗时
+                  （source 已存在但 target 改变的句对计为 updated）
+        """
+        started_at = time.perf_counter()
+        collection_name = self._check_csv(file_path)
+
+        self._ensure_registry()
+        if collection_name not in self._handles:
+            collection_name, count, elapsed = self.build_collection(file_path, progress_callback, cancel_event)
+            return {"collection_name": collection_name, "added": count, "updated": 0, "deleted": 0,
+                    "skipped": 0, "elapsed": round(elapsed, 3)}
+
+        with self._writing_collection(collection_name):
+            collection = self._handles[collection_name]
+            stored = self._load_stored_pairs(collection)
+            added = {}
+            snapshot = None
+            try:
+                seen, rows = self._ingest_csv(collection, file_path, stored, added, progress_callback, cancel_event)
+                stale = [pair_id for pair_id in stored if pair_id not in seen]
+                stale_stored_ids = [stored_id for pair_id in stale for stored_id in stored[pair_id][1]]
+                snapshot = self._snapshot_ids(collection, stale_stored_ids)
+                self._delete_ids(collection, stale_stored_ids)
+            except BaseException:
+                # 回滚本次写入的句对，并恢复已被删除的旧句对
+                try:
+                    self._delete_ids(collection, list(added))
+                    if snapshot is not None:
+                        self._restore_snapshot(collection, snapshot)
+                except Exception as cleanup_error:
+                    logger.warning(f"回滚知识库 '{collection_name}' 的增量写入失败: {cleanup_error}")
+                raise
+
+            stored_sources = {pair[0] for pair, _ in stored.values()}
+            added_sources = {source for source, _ in added.values()}
+            updated = sum(1 for source, _ in added.values() if source in stored_sources)
+            deleted = sum(1 for pair_id in stale if stored[pair_id][0][0] not in added_sources)
+
+            # 用同步后的句对整体替换内存索引
+            stale_ids = set(stale)
+            kept = [pair for pair_id, (pair, stored_ids) in stored.items() if pair_id not in stale_ids
+                    for _ in stored_ids]
+            with self._index_lock:
+                self._set_index(collection_name, CollectionIndex(collection_name, kept + list(added.values())))
 
-            msg = f"✅ 知识库 '{collection_name}' 构建成功，包含 {len(sentences)} 个句对。"
-            logger.info(msg)
+            # 条目数可能不变，更新构建时间以刷新签名与知识库版本
+            try:
+                collection.modify(metadata={**(collection.metadata or {}), "built_at": time.time()})
+                self._touch_registry_stamp()
+            except Exception as e:
+                logger.warning(f"更新知识库 '{collection_name}' 的构建时间失败: {e}")
+            self._register_collection(collection)
+        self._sync_vector_store(collection)
+
+        report = {
+            "collection_name": collection_name,
+            "added": len(added) - updated,
+            "updated": updated,
+            "deleted": deleted,
+            "skipped": rows - len(added),
+            "elapsed": round(time.perf_counter() - started_at, 3),
+        }
+        logger.info(f"知识库增量同步完成: {report}")
+        return report
+
+    def delete_pairs(self, collection_name: str, pairs: List[tuple]) -> int:
+        """
+        从知识库中删除指定的句对（包括重复存储的条目）。
+        Args:
+            collection_name: 知识库名称
+            pairs: (source, target) 列表
+        Returns:
+            int: 删除的条目数
+        """
+        collection = self._get_collections(collection_name)[0]
+        # 在删除前加载索引，避免首次加载时读到删除后的状态再重复删除
+        index = self._get_index(collection)
+        ids, removed = [], []
+        for source, target in dict.fromkeys(pairs):
+            matched = collection.get(where={"$and": [{"source": source}, {"target": target}]})['ids']
+            ids.extend(matched)
+            removed.extend([(source, target)] * len(matched))
+        if not ids:
+            return 0
 
-            # 5. 返回更新后的列表
-            updated_list = self.get_collections_list()
-            return updated_list, msg
+        with self._writing_collection(collection_name):
+            self._delete_ids(collection, ids)
+            with self._index_lock:
+                index.remove_pairs(removed)
+                self._glossary.set_collection(collection_name, index.sources())
+            self._register_collection(collection)
+        self._sync_vector_store(collection)
+        logger.info(f"已从知识库 '{collection_name}' 删除 {len(ids)} 个句对")
+        return len(ids)
 
+    def build_knowledge_base(
+            self,
+            file_path: str,
+            current_kbs: List[Dict] = None,
+            progress_callback: Callable[[Dict], None] = None
+    ) -> tuple:
+        """
+        核心函数：将上传的文件构建为 ChromaDB collection。
+        Args:
+            file_path (str): 上传文件的临时路径
+            progress_callback: 构建进度回调，见 build_collection
+        Returns:
+            tuple: (updated_list, status_message)
+        """
+        try:
+            collection_name, rows, elapsed = self.build_collection(file_path, progress_callback)
+        except ValueError as e:
+            logger.warning(str(e))
+            return current_kbs, str(e)
         except Exception as e:
             logger.error(f"构建知识库失败: {e}")
             return current_kbs, f"❌ 构建失败: {str(e)}"
 
+        msg = f"✅ 知识库 '{collection_name}' 构建成功，包含 {rows} 个句对，耗时 {elapsed:.1f} 秒。"
+        logger.info(msg)
+
+        # 5. 返回更新后的列表
+        updated_list = self.get_collections_list()
+        return updated_list, msg
+
     def delete_collections(self, selected_names: List[str], current_kbs: List[Dict] = None) -> tuple:
         """
         删除指定名称的 collections。
@@ -172,6 +1032,12 @@ class RAGManager:
         if failed:
             msg_parts.append(f"❌ 删除失败 {len(failed)} 个: {'; '.join(failed)}")
 
+        if deleted:
+            self._unregister_collections(deleted)
+            if self._vector_store is not None:
+                for name in deleted:
+                    self._vector_store.drop(name)
+
         updated_list = self.get_collections_list()
         return updated_list, "\n".join(msg_parts) if msg_parts else "操作完成。"
 
@@ -189,7 +1055,7 @@ class RAGManager:
     def extract_chinese_entities(self, text: str) -> Set[str]:
         """
         提取文本中的中文实体（如人名、专有名词）。
-        使用简单规则 + jieba 分词。
+        使用简单规则 + jieba 分词，已加载知识库的术语作为自定义词整体切出，不受长度限制。
         """
         # 简单规则：连续2-5个中文字符（可能是人名、术语）
         basic_entities = set(re.findall(r'[\u4e00-\u9fa5]{2,5}', text))
@@ -197,8 +1063,11 @@ class RAGManager:
         # 使用 jieba 分词（如果安装了 jieba）
         try:
             words = jieba.lcut(text)
-            # 过滤出可能是实体的词（长度2-5的中文词）
-            jieba_entities = {w for w in words if 2 <= len(w) <= 5 and re.fullmatch(r'[\u4e00-\u9fa5]+', w)}
+            # 过滤出可能是实体的词（长度2-5的中文词或知识库术语）
+            jieba_entities = {
+                w for w in words
+                if w in self._glossary or (2 <= len(w) <= 5 and re.fullmatch(r'[\u4e00-\u9fa5]+', w))
+            }
             return basic_entities.union(jieba_entities)
         except ImportError:
             return basic_entities
@@ -206,111 +1075,189 @@ class RAGManager:
     def retrieve_similar_pairs(
             self,
             query: str,
-            collection_name: str = None,
+            collection_name: Union[str, List[str]] = None,
             n_results: int = 3,
             similarity_threshold: float = 0.3
     ) -> List[Dict]:
+        """
+        从知识库中检索与单条查询最相关的句对。
+        """
+        return self.retrieve_similar_pairs_batch(
+            [query],
+            collection_name=collection_name,
+            n_results=n_results,
+            similarity_threshold=similarity_threshold
+        )[0]
+
+    def retrieve_similar_pairs_batch(
+            self,
+            queries: List[str],
+            collection_name: Union[str, List[str]] = None,
+            n_results: int = 3,
+            similarity_threshold: float = 0.3
+    ) -> List[List[Dict]]:
+        """
+        一次性为多条查询检索相关句对。
+        所有查询共用一次 collection 列表查询、一次批量向量编码，
+        语义检索在选中的全部 collection 上合并执行一次。
+        关键词匹配、BM25 与语义检索三路候选按倒数排名融合排序。
+        Args:
+            queries: 查询文本列表
+            collection_name: 指定 collection 名称或名称列表，为空时检索全部
+            n_results: 每条查询返回的最大结果数
+            similarity_threshold: 语义检索的距离阈值
+        Returns:
+            List[List[Dict]]: 与 queries 一一对应的检索结果
+        """
+        if not queries:
+            return []
+
         try:
-            if collection_name:
-                collections = [self.chroma_client.get_collection(name=collection_name)]
-            else:
-                collections = [self.chroma_client.get_collection(name=c) for c in self.chroma_client.list_collections()]
+            collections = self._get_collections(collection_name)
 
             if not collections:
                 logger.info("No collections found in ChromaDB.")
-                return []
+                return [[] for _ in queries]
 
-            query_embedding = self.embedding_model.encode([query]).tolist()
-            results = []
+            query_embeddings = self.encode_queries(queries)
 
-            # >>>>>>>>>>>> 提取英文术语（支持长单词） <<<<<<<<<<<<
-            english_terms = self.extract_english_terms(query)
-            logger.info(f"从查询中提取到英文术语: {english_terms}")
+            # 先加载内存索引，知识库术语注册到 jieba 后再提取关键词
+            indexes = {}
+            for coll in collections:
+                try:
+                    indexes[coll.name] = self._get_index(coll)
+                except Exception as e:
+                    logger.debug(f"加载内存索引出错: {e}")
+
+            keywords_list = []
+            for query in queries:
+                # >>>>>>>>>>>> 提取英文术语（支持长单词） <<<<<<<<<<<<
+                english_terms = self.extract_english_terms(query)
+                logger.info(f"从查询中提取到英文术语: {english_terms}")
 
-            # >>>>>>>>>>>> 提取中文实体 <<<<<<<<<<<<
-            chinese_entities = self.extract_chinese_entities(query)
-            logger.info(f"从查询中提取到中文实体: {chinese_entities}")
+                # >>>>>>>>>>>> 提取中文实体 <<<<<<<<<<<<
+                chinese_entities = self.extract_chinese_entities(query)
+                logger.info(f"从查询中提取到中文实体: {chinese_entities}")
 
-            # 合并所有要精确匹配的关键词
-            exact_keywords = english_terms.union(chinese_entities)
-            logger.info(f"综合关键词: {exact_keywords}")
+                # 合并所有要精确匹配的关键词，按在查询中出现的位置排序（同位置时长词在前），
+                # 保证各进程中精确匹配结果的顺序一致
+                exact_keywords = sorted(
+                    english_terms.union(chinese_entities),
+                    key=lambda keyword: (query.find(keyword), -len(keyword), keyword)
+                )
+                logger.info(f"综合关键词: {exact_keywords}")
+                keywords_list.append(exact_keywords)
+
+            # 三路召回各自产生排好序的候选列表，最后用倒数排名融合（RRF）合并
+            lexical = [[] for _ in queries]
+            bm25 = [[] for _ in queries]
+            semantic = [[] for _ in queries]
+            candidates = max(n_results, Config.RAG_RRF_CANDIDATES)
 
             for coll in collections:
-                # 1. 精确匹配：检查 source 是否在关键词中（正向匹配）
-                for keyword in exact_keywords:
-                    try:
-                        res = coll.get(
-                            where={"source": keyword.lower() if keyword.isascii() else keyword},
-                            include=["metadatas", "documents"]
-                        )
-                        if res['ids']:
-                            for i in range(len(res['ids'])):
-                                results.append({
-                                    "source": res['metadatas'][i]['source'],
-                                    "target": res['metadatas'][i]['target'],
-                                    "distance": 0.0,
-                                    "collection": coll.name,
-                                    "match_type": "exact_keyword"
-                                })
-                    except Exception as e:
-                        logger.debug(f"精确匹配 {keyword} 时出错: {e}")
-                        continue
-
-                # 2. 子串匹配：如果 query 包含 source，且 source 是短字符串（可能是实体）
+                index = indexes.get(coll.name)
+                if index is None:
+                    continue
+
+                # 1. 关键词匹配：source 与关键词一致的句对在前，
+                #    其次是 query 包含的短 source（子串），越长的 source 越具体
                 try:
-                    # 获取 collection 中的所有 source
-                    all_items = coll.get(include=["metadatas"])
-                    for meta in all_items['metadatas']:
-                        source = meta['source']
-                        # 如果 source 是短字符串（如人名、术语），且出现在 query 中
-                        if len(source) <= 10 and (source in query or source.lower() in query.lower()):
-                            results.append({
-                                "source": source,
-                                "target": meta['target'],
-                                "distance": 0.1,  # 比完全匹配稍低
-                                "collection": coll.name,
-                                "match_type": "substring_match"
-                            })
+                    for idx, (query, exact_keywords) in enumerate(zip(queries, keywords_list)):
+                        exact = [pair for keyword in exact_keywords for pair in index.lookup_exact(keyword)]
+                        substrings = sorted(index.find_substrings(query), key=lambda pair: len(pair[0]), reverse=True)
+                        for pair in exact:
+                            lexical[idx].append((0, self._result_item(pair, coll.name, "exact_keyword")))
+                        for pair in substrings:
+                            lexical[idx].append((1, self._result_item(pair, coll.name, "substring_match")))
                 except Exception as e:
-                    logger.debug(f"子串匹配出错: {e}")
+                    logger.debug(f"关键词匹配出错: {e}")
 
-                # 3. 语义相似度检索
+                # 2. BM25 词法检索
                 try:
-                    semantic_res = coll.query(
-                        query_embeddings=query_embedding,
-                        n_results=n_results,
-                        include=["metadatas", "distances"]
-                    )
-                    for i in range(len(semantic_res['ids'][0])):
-                        distance = semantic_res['distances'][0][i]
-                        if distance < similarity_threshold:
-                            metadata = semantic_res['metadatas'][0][i]
-                            results.append({
-                                "source": metadata.get("source", metadata.get("document")),
-                                "target": metadata["target"],
-                                "distance": distance,
-                                "collection": coll.name,
-                                "match_type": "semantic"
-                            })
+                    for idx, query in enumerate(queries):
+                        for pair, score in index.search_bm25(query, candidates, Config.RAG_BM25_MIN_COVERAGE):
+                            bm25[idx].append((score, self._result_item(pair, coll.name, "bm25")))
                 except Exception as e:
-                    logger.debug(f"语义检索出错: {e}")
+                    logger.debug(f"BM25 检索出错: {e}")
 
-            # 去重：基于 (source, target)
-            seen = set()
-            unique_results = []
-            for item in results:
-                key = (item['source'], item['target'])
-                if key not in seen:
-                    seen.add(key)
-                    unique_results.append(item)
+            # 3. 语义相似度检索：全部 collection 合并为一次检索，得到全局 top-k
+            try:
+                semantic_res = self._semantic_search(collections, query_embeddings, candidates)
+                for idx, hits in enumerate(semantic_res):
+                    for distance, name, metadata in hits:
+                        if distance < similarity_threshold:
+                            pair = (metadata.get("source", metadata.get("document")), metadata["target"])
+                            item = self._result_item(pair, name, "semantic")
+                            item["distance"] = distance
+                            semantic[idx].append(item)
+            except Exception as e:
+                logger.debug(f"语义检索出错: {e}")
 
-            # 按 distance 排序
-            unique_results.sort(key=lambda x: x['distance'])
-            return unique_results[:n_results]
+            fused = []
+            for idx in range(len(queries)):
+                # 关键词列表按匹配类型排序（稳定排序保留 collection 顺序），BM25 跨 collection 按分数合并
+                lexical_ranked = [item for _, item in sorted(lexical[idx], key=lambda x: x[0])]
+                bm25_ranked = [item for _, item in sorted(bm25[idx], key=lambda x: x[0], reverse=True)][:candidates]
+                # 术语精确命中是最可靠的证据，固定排在融合结果之前
+                pinned = [item for rank, item in lexical[idx] if rank == 0]
+                fused.append(self._fuse_ranked_lists(
+                    [lexical_ranked, bm25_ranked, semantic[idx]], n_results, pinned=pinned
+                ))
+            return fused
 
         except Exception as e:
             logger.error(f"检索失败: {e}")
-            return []
+            return [[] for _ in queries]
+
+    @staticmethod
+    def _result_item(pair, collection_name: str, match_type: str) -> Dict:
+        source, target = pair
+        return {
+            "source": source,
+            "target": target,
+            "distance": None,
+            "collection": collection_name,
+            "match_type": match_type
+        }
+
+    def _fuse_ranked_lists(self, ranked_lists: List[List[Dict]], n_results: int,
+                           pinned: List[Dict] = None) -> List[Dict]:
+        """
+        倒数排名融合：句对在每个列表中的得分为 1 / (Config.RAG_RRF_K + 名次)，各列表得分相加，
+        多路同时召回的句对排在前面。基于 (source, target) 去重，截取前 n_results 条。
+        pinned 中的句对按给定顺序排在所有其他句对之前，不受融合得分影响。
+        结果保留首次出现时的字段，score 为融合得分，match_types 为召回该句对的全部方式，
+        distance 仅对语义召回的句对有值。
+        """
+        pinned_rank: Dict = {}
+        for item in pinned or []:
+            pinned_rank.setdefault((item['source'], item['target']), len(pinned_rank))
+
+        merged: Dict = {}
+        for ranked in ranked_lists:
+            seen = set()
+            for rank, item in enumerate(ranked, start=1):
+                key = (item['source'], item['target'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                entry = merged.get(key)
+                if entry is None:
+                    entry = merged[key] = dict(item, score=0.0, match_types=[])
+                entry["score"] += 1.0 / (Config.RAG_RRF_K + rank)
+                if item["match_type"] not in entry["match_types"]:
+                    entry["match_types"].append(item["match_type"])
+                if item["distance"] is not None:
+                    entry["distance"] = item["distance"]
+
+        def order(entry):
+            key = (entry['source'], entry['target'])
+            if key in pinned_rank:
+                return 0, pinned_rank[key], 0.0
+            return 1, 0, -entry["score"]
+
+        fused = sorted(merged.values(), key=order)
+        return fused[:n_results]
 
 # 创建全局实例
 ragManager = RAGManager()
\ No newline at end of file
@@ -4,6 +4,8 @@ import os
 import re
 # 用于JSON数据的序列化和反序列化
 import json
+# 用于并发调度批量翻译任务
+import asyncio
 # 用于定义异步上下文管理器
 from contextlib import asynccontextmanager
 # 用于类型提示，定义列表和可选参数
@@ -20,6 +22,9 @@ from concurrent_log_handler import ConcurrentRotatingFileHandler
 # 导入系统模块，用于处理系统相关的操作，如退出程序
 import sys
 import time
+# 用于保存上传的知识库文件
+import shutil
+import tempfile
 # 导入UUID模块，用于生成唯一标识符
 import uuid
 # 从typing模块导入类型提示工具
@@ -27,15 +32,28 @@ from typing import Optional
 # 导入Pydantic的基类和字段定义工具
 from pydantic import BaseModel
 # 导入自定义的get_llm函数，用于获取LLM模型
-from utils.llms import get_llm
+from utils.llms import get_llm, initialize_llm, get_model_name, get_llm_router, RoutingScope, enter_routing_scope
 # 导入统一的 Config 类
 from utils.config import Config
+# 导入请求合并工具，相同的并发翻译请求只调用一次模型
+from utils.singleflight import SingleFlight
+# 导入阶段执行器，将同步的检索和推理移出事件循环
+from utils.executors import StageExecutor
+# 导入本地 HuggingFace 模型的微批调度器
+from utils.hf_batcher import HFMicroBatcher
+# 导入熔断器，后端故障时快速失败并切换到备用后端
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+# 导入对冲请求工具，降低慢后端造成的长尾延迟
+from utils.hedging import Hedger
 
 from langgraph.prebuilt import create_react_agent
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, AIMessageChunk
+from langchain_core.language_models.chat_models import BaseChatModel
 from langgraph.checkpoint.memory import MemorySaver
 
 from rag_manager import ragManager
+from translation_cache import translationCache
+from kb_jobs import kbJobManager, BUILD, UPSERT
 
 
 """
@@ -84,7 +102,22 @@ class ChatCompletionRequest(BaseModel):
     userId: Optional[str] = None
     conversationId: Optional[str] = None
 
+# 定义批量翻译请求模型，所有片段共用同一个翻译方向
+class BatchTranslateRequest(BaseModel):
+    segments: List[str]
+    translateType: Optional[Literal['en2cn', 'cn2en']] = 'en2cn'
+    userId: Optional[str] = None
+    conversationId: Optional[str] = None
+    maxConcurrency: Optional[int] = None
+
 # 定义用于删除知识库的请求模型
+class PairItem(BaseModel):
+    source: str
+    target: str
+
+class DeletePairsRequest(BaseModel):
+    pairs: List[PairItem]
+
 class DeleteCollectionsRequest(BaseModel):
     names: List[str]
 
@@ -103,13 +136,10 @@ async def lifespan(app: FastAPI):
     Raises:
         Exception: 其他未预期的异常。
     """
-    # 声明全局变量 agent
-    global agent
+    # 声明全局变量 agent、model_name、system_message 和 fallback_agent
+    global agent, model_name, system_message, fallback_agent
 
     try:
-        # 调用 get_llm 初始化聊天模型
-        llm_chat = get_llm(Config.LLM_TYPE)
-
         # 定义系统消息，指导如何使用工具
         system_message = SystemMessage(content=(
                "你是一个专业的中英翻译员，必须严格遵守用户提供的术语翻译规则。"
@@ -119,26 +149,32 @@ async def lifespan(app: FastAPI):
                "翻译速度要快,翻译速度要快,翻译速度要快。"
         ))
 
-        # 这里使用内存存储 也可以持久化到数据库
-        memory = MemorySaver()
-
-        # 检查 llm_chat 类型，如果是 HuggingFacePipeline，则使用不同的处理方式
-        if hasattr(llm_chat, 'pipeline'):
-            # 对于 HuggingFacePipeline，我们不使用 create_react_agent
-            # 直接使用模型进行推理
-            agent = llm_chat
-        else:
-            # 对于 ChatOpenAI 等模型，使用 create_react_agent
-            agent = create_react_agent(
-                model=llm_chat,
-                tools=[],
-                prompt=system_message,
-                # checkpointer=memory,
-            )
+        # 调用 get_llm 初始化聊天模型
+        llm_chat = get_llm(Config.LLM_TYPE)
+        # 记录实际使用的模型名称，用于流式输出的 chunk 中
+        model_name = get_model_name(llm_chat)
+        agent = create_agent(Config.LLM_TYPE, llm_chat)
+
+        # 初始化运行时故障切换使用的备用后端，失败时仅告警，不影响主后端启动
+        if Config.FALLBACK_LLM_TYPE and Config.FALLBACK_LLM_TYPE != Config.LLM_TYPE:
+            try:
+                fallback_agent = create_agent(Config.FALLBACK_LLM_TYPE, initialize_llm(Config.FALLBACK_LLM_TYPE))
+                logger.info(f"Fallback backend ready: {Config.FALLBACK_LLM_TYPE}")
+            except Exception as e:
+                logger.warning(f"Fallback backend {Config.FALLBACK_LLM_TYPE} unavailable: {e}")
 
         # 保存状态图的可视化表示
         # save_graph_visualization(agent)
 
+        # 知识库构建或删除后，旧的翻译结果可能不再符合术语规则，需清空缓存
+        ragManager.add_change_listener(translationCache.clear)
+
+        # 预加载知识库内存索引并注册术语，首个请求无需等待；失败时仅告警，检索时仍会按需加载
+        try:
+            await rag_executor.run(ragManager.warm_up)
+        except Exception as e:
+            logger.warning(f"Knowledge base warm-up failed: {e}")
+
     except Exception as e:
         # 捕获并记录其他未预期的异常
         logger.error(f"Unexpected error: {e}")
@@ -147,9 +183,99 @@ async def lifespan(app: FastAPI):
 
     # yield 表示应用运行期间，初始化完成后进入运行状态
     yield
+    for llm_router in llm_routers.values():
+        llm_router.stop_health_checks()
+    if hf_batcher is not None:
+        hf_batcher.shutdown()
+    rag_executor.shutdown()
+    hf_executor.shutdown()
+    kbJobManager.shutdown()
+    ragManager.shutdown()
     # 记录服务关闭的日志
     logger.info("The service has been shut down")
 
+def create_agent(llm_type: str, llm_chat):
+    """
+    根据模型类型和执行模式构建调用对象，并为该后端创建熔断器。
+
+    Args:
+        llm_type (str): 后端类型，如 'chatglm'、'ollama'、'huggingface'。
+        llm_chat: get_llm/initialize_llm 返回的模型实例。
+
+    Returns:
+        react agent、聊天模型或 HuggingFacePipeline 实例。
+    """
+    global hf_batcher
+
+    # 配置了多个端点时，启动后台健康检查
+    llm_router = get_llm_router(llm_chat)
+    if llm_router is not None:
+        llm_router.start_health_checks()
+        llm_routers[llm_type] = llm_router
+
+    breakers[llm_type] = CircuitBreaker(
+        llm_type,
+        failure_rate_threshold=Config.BREAKER_FAILURE_RATE,
+        window_size=Config.BREAKER_WINDOW_SIZE,
+        min_calls=Config.BREAKER_MIN_CALLS,
+        slow_call_seconds=Config.BREAKER_SLOW_CALL_SECONDS,
+        open_seconds=Config.BREAKER_OPEN_SECONDS
+    )
+
+    # 这里使用内存存储 也可以持久化到数据库
+    memory = MemorySaver()
+
+    # 检查 llm_chat 类型，如果是 HuggingFacePipeline，则使用不同的处理方式
+    if hasattr(llm_chat, 'pipeline'):
+        # 对于 HuggingFacePipeline，我们不使用 create_react_agent
+        # 直接使用模型进行推理
+        if Config.HF_BATCH_ENABLED:
+            # 并发请求合并为一个批次推理，提高单个模型实例的吞吐
+            hf_batcher = HFMicroBatcher(
+                llm_chat,
+                hf_executor,
+                max_batch_size=Config.HF_MAX_BATCH_SIZE,
+                max_wait_ms=Config.HF_BATCH_WAIT_MS
+            )
+        agent = llm_chat
+    elif Config.EXECUTION_MODE == "direct":
+        # 直连模式：没有工具时 react agent 只是额外开销，直接调用聊天模型
+        agent = llm_chat
+        logger.info(f"Execution mode for {llm_type}: direct LLM")
+    else:
+        # 对于 ChatOpenAI 等模型，使用 create_react_agent
+        agent = create_react_agent(
+            model=llm_chat,
+            tools=[],
+            prompt=system_message,
+            # checkpointer=memory,
+        )
+    agent_backends[id(agent)] = llm_type
+    return agent
+
+# 合并相同的进行中翻译请求（相同原文、方向、模型与知识库版本）
+inflight_translations = SingleFlight()
+
+# RAG 检索（向量编码、jieba、Chroma 查询）和本地模型推理都是同步阻塞调用，分别放入独立线程池
+rag_executor = StageExecutor("rag", Config.RAG_EXECUTOR_WORKERS)
+hf_executor = StageExecutor("hf", Config.HF_EXECUTOR_WORKERS)
+# 本地 HuggingFace 模型的微批调度器，仅在 huggingface 后端启用时创建
+hf_batcher = None
+# 多端点路由器，仅对配置了多个 OpenAI 兼容端点的后端存在
+llm_routers = {}
+# 各后端的熔断器，以及 agent 到后端类型的映射
+breakers = {}
+agent_backends = {}
+# 运行时故障切换使用的备用后端
+fallback_agent = None
+# 对冲请求调度器，未启用时为 None
+hedger = Hedger(
+    percentile=Config.HEDGE_PERCENTILE,
+    max_hedge_ratio=Config.HEDGE_MAX_RATIO,
+    initial_delay=Config.HEDGE_INITIAL_DELAY,
+    min_delay=Config.HEDGE_MIN_DELAY
+) if Config.HEDGE_ENABLED else None
+
 # 创建FastAPI实例 lifespan参数用于在应用程序生命周期的开始和结束时执行一些初始化或清理工作
 app = FastAPI(lifespan=lifespan)
 
@@ -168,6 +294,348 @@ async def get_dependencies() -> Tuple[any]:
         raise HTTPException(status_code=500, detail="Service not initialized")
     return agent
 
+def get_direction_tip(translate_type: str) -> str:
+    """
+    根据翻译方向返回“控制性”提示语。
+
+    Raises:
+        HTTPException: 翻译方向不受支持时抛出 400 错误。
+    """
+    if translate_type == "cn2en":
+        return "根据以上规则，将下面这段话翻译成英文："
+    elif translate_type == "en2cn":
+        return "根据以上规则，将下面这段话翻译成中文:"
+    raise HTTPException(status_code=400, detail="Unsupported translate_type: should be 'cn2en' or 'en2cn'")
+
+def format_rag_prompt(relevant_pairs: List[dict]) -> str:
+    """
+    将检索到的术语/句对格式化为强制翻译规则。
+    """
+    rag_prompt = ""
+    if relevant_pairs:
+        rag_prompt = (
+            "### 翻译强制规则 (MUST FOLLOW)\n"
+            "在进行以下翻译时，你必须严格遵守以下术语替换规则。这些是用户指定的官方或专有译名，优先级高于你的任何内部知识。\n"
+            "如果原文中出现规则中的源文本，必须且只能使用对应的译文，不得音译、意译或使用其他变体。\n\n"
+        )
+        for i, pair in enumerate(relevant_pairs):
+            rag_prompt += f"规则 {i + 1}: '{pair['source']}' → '{pair['target']}'\n"
+        rag_prompt += "\n"
+    return rag_prompt
+
+async def build_translate_prompt(user_input: str, translate_type: str, relevant_pairs: Optional[List[dict]] = None) -> str:
+    """
+    检索 RAG 术语规则并拼接完整的翻译提示词。
+
+    Args:
+        user_input (str): 待翻译的原文。
+        translate_type (str): 翻译方向，'cn2en' 或 'en2cn'。
+        relevant_pairs (List[dict], optional): 已检索好的句对，为空时现场检索。
+
+    Returns:
+        str: 包含术语规则、方向提示和原文的完整提示词。
+
+    Raises:
+        HTTPException: 翻译方向不受支持时抛出 400 错误。
+    """
+    # 在 messages 中拼接一条“控制性” HumanMessage，指定翻译方向
+    direction_tip = get_direction_tip(translate_type)
+
+    if relevant_pairs is None:
+        # 从所有知识库中检索最相似的 3 个句对
+        relevant_pairs = await rag_executor.run(ragManager.retrieve_similar_pairs, query=user_input, n_results=3)
+    logger.info(f"RAG 检索到 {len(relevant_pairs)} 个相关术语/句对")
+
+    return format_rag_prompt(relevant_pairs) + direction_tip + user_input
+
+async def invoke_agent(agent, prompt_text: str, config: dict) -> dict:
+    """
+    以非流式方式调用模型，返回 {"messages": [...]} 结构的结果。
+    """
+    # 检查 agent 类型并使用相应的调用方式
+    if isinstance(agent, BaseChatModel):
+        # 直连模式：系统提示词 + 提示词直接发给模型，只返回精简的译文消息
+        response = await agent.ainvoke([system_message, HumanMessage(content=prompt_text)], config)
+        return {"messages": [AIMessage(content=response.content)]}
+    if hasattr(agent, 'pipeline'):
+        # 对于 HuggingFacePipeline，直接调用，但需要传递正确的内容
+        # HuggingFacePipeline 需要直接传递消息内容而不是 HumanMessage 对象
+        if hf_batcher is not None:
+            response = await hf_batcher.submit(prompt_text)
+        else:
+            response = await hf_executor.run(agent.invoke, prompt_text)
+        # 构造符合预期格式的响应
+        return {"messages": [AIMessage(content=response)]}
+    # 对于其他模型，使用 agent.ainvoke
+    return await agent.ainvoke({"messages": [HumanMessage(content=prompt_text)]}, config)
+
+def extract_translation(output_message: dict) -> str:
+    """
+    从 agent 输出中取出最后一条 AI 消息的文本作为译文。
+    """
+    for message in reversed(output_message.get("messages", [])):
+        if isinstance(message, AIMessage):
+            return message.content
+    return ""
+
+def build_run_config(request: ChatCompletionRequest) -> dict:
+    """
+    定义运行时配置，包含线程ID和用户ID，使用默认值防止未定义。
+    """
+    return {
+        "configurable": {
+            "thread_id": f"{getattr(request, 'userId', 'unknown')}@@{getattr(request, 'conversationId', 'default')}",
+            "user_id": getattr(request, 'userId', 'unknown')
+        }
+    }
+
+def make_cache_key(user_input: str, translate_type: str) -> str:
+    """
+    生成翻译结果缓存键：原文、翻译方向、模型与知识库版本任一变化都会得到不同的键。
+    """
+    return translationCache.make_key(
+        user_input,
+        translate_type,
+        Config.LLM_TYPE,
+        model_name,
+        ragManager.get_kb_version()
+    )
+
+def lookup_cached_translations(segments: List[str], translate_type: str) -> Tuple[list, list]:
+    """
+    计算每个片段的缓存键并查询翻译结果缓存，空白片段的键和结果均为 None。
+    读取知识库版本和 SQLite 缓存都会阻塞，需要放在 rag_executor 中执行。
+    """
+    keys = [None] * len(segments)
+    cached = [None] * len(segments)
+    for i, segment in enumerate(segments):
+        if segment and segment.strip():
+            keys[i] = make_cache_key(segment, translate_type)
+            if Config.CACHE_ENABLED:
+                cached[i] = translationCache.get(keys[i])
+    return keys, cached
+
+def format_stream_chunk(chunk_id: str, created: int, delta: dict, finish_reason: Optional[str] = None) -> str:
+    """
+    按 OpenAI chat.completion.chunk 格式封装一条 SSE 数据。
+
+    Args:
+        chunk_id (str): 本次流式响应的唯一 ID，所有 chunk 共用。
+        created (int): 响应创建时间戳（秒）。
+        delta (dict): 增量内容，如 {"content": "..."}。
+        finish_reason (str, optional): 结束原因，最后一个 chunk 为 'stop'。
+
+    Returns:
+        str: 以 "data: " 开头、空行结尾的 SSE 事件文本。
+    """
+    payload = {
+        "id": chunk_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model_name,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def astream_tokens(agent, prompt_text: str, config: dict):
+    """
+    逐个产出模型生成的文本增量。
+
+    ChatOpenAI/Ollama 通过 LangGraph 的 messages 流模式获取 token，
+    直连模式和 HuggingFacePipeline 则直接使用模型的 astream 接口。
+    """
+    if hasattr(agent, 'pipeline'):
+        # 与非流式调用共用 hf 线程池，使本地推理的并发受同一上限约束
+        async for token in hf_executor.stream(agent.stream, prompt_text):
+            if token:
+                yield token
+    elif isinstance(agent, BaseChatModel):
+        async for message_chunk in agent.astream([system_message, HumanMessage(content=prompt_text)], config):
+            if message_chunk.content:
+                yield message_chunk.content
+    else:
+        async for message_chunk, metadata in agent.astream(
+                {"messages": [HumanMessage(content=prompt_text)]},
+                config,
+                stream_mode="messages"
+        ):
+            # 只转发模型生成的增量消息，忽略输入回显等其他消息
+            if isinstance(message_chunk, AIMessageChunk) and message_chunk.content:
+                yield message_chunk.content
+
+def failover_candidates(agent) -> list:
+    """
+    返回按优先级排列的可用后端：主后端在前，备用后端（如有）在后。
+    """
+    if fallback_agent is not None and fallback_agent is not agent:
+        return [agent, fallback_agent]
+    return [agent]
+
+def get_breaker(agent) -> Optional[CircuitBreaker]:
+    """
+    返回 agent 所属后端的熔断器。
+    """
+    return breakers.get(agent_backends.get(id(agent)))
+
+def get_hedge_target(agent, exclude=None):
+    """
+    返回对冲请求的目标：主后端除主请求所在端点外还有健康端点时对冲到同一后端
+    （调用时避开 exclude），否则对冲到备用后端；都没有时返回 None。
+    """
+    llm_router = llm_routers.get(agent_backends.get(id(agent)))
+    if llm_router is not None and len(llm_router.endpoints) > 1 and llm_router.has_alternative(exclude):
+        return agent
+    return fallback_agent
+
+async def invoke_primary(agent, prompt_text: str, config: dict) -> Tuple[dict, bool]:
+    """
+    调用主后端；启用对冲时以流式方式调用，首 token 迟迟未到则发出对冲请求。
+    对冲请求避开主请求所在的端点，主后端没有其他健康端点时改用备用后端。
+
+    Returns:
+        Tuple[dict, bool]: (模型输出, 结果是否来自主后端)。
+    """
+    llm_router = llm_routers.get(agent_backends.get(id(agent)))
+    can_hedge = fallback_agent is not None or (llm_router is not None and len(llm_router.endpoints) > 1)
+    if hedger is None or not can_hedge:
+        return await invoke_agent(agent, prompt_text, config), True
+
+    # 主请求与对冲请求运行在各自的任务中，路由记录互不干扰
+    primary_scope = RoutingScope()
+    hedge_target = agent
+
+    def primary():
+        enter_routing_scope(primary_scope)
+        return astream_tokens(agent, prompt_text, config)
+
+    def hedge():
+        nonlocal hedge_target
+        hedge_target = get_hedge_target(agent, primary_scope.endpoint) or agent
+        enter_routing_scope(RoutingScope(exclude=primary_scope.endpoint))
+        return astream_tokens(hedge_target, prompt_text, config)
+
+    text, winner = await hedger.run(primary, hedge)
+    return {"messages": [AIMessage(content=text)]}, winner == 0 or hedge_target is agent
+
+async def invoke_fallback(agent, prompt_text: str, config: dict) -> Tuple[dict, bool]:
+    """
+    调用备用后端，结果标记为非主后端产出。
+    """
+    return await invoke_agent(agent, prompt_text, config), False
+
+async def call_with_failover(agent, prompt_text: str, config: dict) -> Tuple[dict, bool]:
+    """
+    在熔断器保护下调用模型，主后端失败或熔断时切换到备用后端。
+
+    Args:
+        agent: 主后端的调用对象。
+        prompt_text (str): 完整的翻译提示词。
+        config (dict): 运行时配置。
+
+    Returns:
+        Tuple[dict, bool]: (模型输出, 是否由主后端完成)。
+
+    Raises:
+        Exception: 所有后端都失败时抛出最后一个异常，全部熔断时为 CircuitOpenError。
+    """
+    last_error = None
+    candidates = failover_candidates(agent)
+    for position, candidate in enumerate(candidates):
+        breaker = get_breaker(candidate)
+        invoke = invoke_primary if candidate is agent else invoke_fallback
+        # 只有后面还有备用后端时才限制耗时，否则超时只会让本可成功的长翻译失败；
+        # HuggingFace 推理在线程池中执行，取消等待并不能停止生成，也不设超时
+        has_next = position < len(candidates) - 1
+        timeout = Config.LLM_CALL_TIMEOUT if has_next and not hasattr(candidate, 'pipeline') else None
+        try:
+            if breaker is None:
+                return await invoke(candidate, prompt_text, config)
+            return await breaker.call(
+                lambda: invoke(candidate, prompt_text, config),
+                timeout=timeout
+            )
+        except Exception as e:
+            last_error = e
+            logger.warning(f"Backend {agent_backends.get(id(candidate))} failed: {e!r}")
+    raise last_error
+
+async def stream_translation(agent, prompt_text: str, config: dict, cache_key: Optional[str] = None):
+    """
+    以 SSE 方式逐 token 转发模型输出。
+
+    主后端熔断或在产出首个 token 前失败时，自动切换到备用后端；
+    一旦已有内容发出，则只能在流中报告错误。
+
+    Args:
+        agent: create_react_agent 构建的 agent、直连模式下的聊天模型或 HuggingFacePipeline 实例。
+        prompt_text (str): 完整的翻译提示词。
+        config (dict): 运行时配置。
+        cache_key (str, optional): 完整生成后写入翻译缓存所用的键。
+
+    Yields:
+        str: OpenAI 兼容的 SSE 数据块，最后以 "data: [DONE]" 结束。
+    """
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    tokens = []
+    last_error = None
+    finished = False
+    # 首个 chunk 只携带角色信息，与 OpenAI 的行为保持一致
+    yield format_stream_chunk(chunk_id, created, {"role": "assistant", "content": ""})
+    for candidate in failover_candidates(agent):
+        breaker = get_breaker(candidate)
+        if breaker is not None and not breaker.acquire():
+            last_error = CircuitOpenError(f"Circuit breaker '{breaker.name}' is open")
+            continue
+        started_at = time.perf_counter()
+        first_token_latency = None
+        recorded = False
+        try:
+            async for token in astream_tokens(candidate, prompt_text, config):
+                if first_token_latency is None:
+                    first_token_latency = time.perf_counter() - started_at
+                tokens.append(token)
+                yield format_stream_chunk(chunk_id, created, {"content": token})
+            if breaker is not None:
+                # 流式输出的总耗时取决于译文长度，慢调用按首 token 延迟判断
+                breaker.record(True, first_token_latency)
+                recorded = True
+            # 备用后端的结果与缓存键中的模型不符，不写入缓存
+            if cache_key and tokens and candidate is agent:
+                await rag_executor.run(translationCache.set, cache_key, "".join(tokens))
+            finished = True
+            break
+        except Exception as e:
+            if breaker is not None:
+                breaker.record(False)
+                recorded = True
+            last_error = e
+            logger.error(f"Error streaming chat completion:\n\n {str(e)}")
+            if tokens:
+                # 已经发出部分内容，无法再切换后端
+                break
+        finally:
+            if breaker is not None and not recorded:
+                breaker.release()
+
+    if finished:
+        yield format_stream_chunk(chunk_id, created, {}, finish_reason="stop")
+    else:
+        # 响应头已发送，无法再返回 500，只能在流中告知客户端错误
+        yield f"data: {json.dumps({'error': {'message': str(last_error)}}, ensure_ascii=False)}\n\n"
+    yield "data: [DONE]\n\n"
+
+async def stream_cached_translation(text: str):
+    """
+    将缓存命中的译文以与实时生成相同的 SSE 格式一次性输出。
+    """
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    yield format_stream_chunk(chunk_id, created, {"role": "assistant", "content": ""})
+    yield format_stream_chunk(chunk_id, created, {"content": text})
+    yield format_stream_chunk(chunk_id, created, {}, finish_reason="stop")
+    yield "data: [DONE]\n\n"
+
 @app.post(Config.TRANSLATEAPI)
 async def chat_translate(request: ChatCompletionRequest, dependencies: Tuple[any] = Depends(get_dependencies)):
     """接收来自前端的请求数据进行业务的处理。
@@ -176,7 +644,7 @@ async def chat_translate(request: ChatCompletionRequest, dependencies: Tuple[any
         request: 请求参数。
 
     Returns:
-        标准的Python字典。
+        标准的Python字典；stream=True 时返回 text/event-stream 流式响应。
     """
     try:
         agent = dependencies
@@ -187,58 +655,131 @@ async def chat_translate(request: ChatCompletionRequest, dependencies: Tuple[any
         user_input = request.messages[-1].content
         logger.info(f"The user's user_input is: {user_input}")
 
-        # 定义运行时配置，包含线程ID和用户ID，使用默认值防止未定义
-        config = {
-            "configurable": {
-                "thread_id": f"{getattr(request, 'userId', 'unknown')}@@{getattr(request, 'conversationId', 'default')}",
-                "user_id": getattr(request, 'userId', 'unknown')
-            }
-        }
-
-        # 从所有知识库中检索最相似的 3 个句对
-        relevant_pairs = ragManager.retrieve_similar_pairs(query=user_input, n_results=3)
-        logger.info(f"RAG 检索到 {len(relevant_pairs)} 个相关术语/句对")
-        rag_prompt = ""
-        if relevant_pairs:
-            rag_prompt = (
-                "### 翻译强制规则 (MUST FOLLOW)\n"
-                "在进行以下翻译时，你必须严格遵守以下术语替换规则。这些是用户指定的官方或专有译名，优先级高于你的任何内部知识。\n"
-                "如果原文中出现规则中的源文本，必须且只能使用对应的译文，不得音译、意译或使用其他变体。\n\n"
+        config = build_run_config(request)
+
+        # 先查翻译结果缓存，命中时跳过 RAG 检索和模型调用；键计算与 SQLite 读写不占用事件循环
+        request_key = await rag_executor.run(make_cache_key, user_input, request.translateType)
+        cache_key = request_key if Config.CACHE_ENABLED else None
+        cached = await rag_executor.run(translationCache.get, cache_key) if cache_key else None
+        if cached is not None:
+            logger.info("Translation cache hit")
+            if request.stream:
+                return StreamingResponse(
+                    stream_cached_translation(cached),
+                    media_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+                )
+            return {"messages": [AIMessage(content=cached)]}
+
+        # 调用流式输出，每个客户端需要各自的 token 流，不参与请求合并
+        if request.stream:
+            full_prompt = await build_translate_prompt(user_input, request.translateType)
+            return StreamingResponse(
+                stream_translation(agent, full_prompt, config, cache_key),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
             )
-            for i, pair in enumerate(relevant_pairs):
-                rag_prompt += f"规则 {i + 1}: '{pair['source']}' → '{pair['target']}'\n"
-            rag_prompt += "\n"
-
-        # 在 messages 中拼接一条“控制性” HumanMessage，指定翻译方向
-        if request.translateType == "cn2en":
-            direction_tip = "根据以上规则，将下面这段话翻译成英文："
-        elif request.translateType == "en2cn":
-            direction_tip = "根据以上规则，将下面这段话翻译成中文:"
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported translate_type: should be 'cn2en' or 'en2cn'")
-
-        input_message = HumanMessage(content=rag_prompt + direction_tip + user_input)
-
-        # 调用非流式输出
-        # 检查 agent 类型并使用相应的调用方式
-        if hasattr(agent, 'pipeline'):
-            # 对于 HuggingFacePipeline，直接调用，但需要传递正确的内容
-            # HuggingFacePipeline 需要直接传递消息内容而不是 HumanMessage 对象
-            full_prompt = rag_prompt + direction_tip + user_input
-            response = agent.invoke(full_prompt)
-            # 构造符合预期格式的响应
-            from langchain_core.messages import AIMessage
-            output_message = {"messages": [AIMessage(content=response)]}
-        else:
-            # 对于其他模型，使用 agent.ainvoke
-            output_message = await agent.ainvoke({"messages": [input_message]}, config)
+
+        # 调用非流式输出，相同的并发请求共享同一次检索和模型调用
+        async def run_translation() -> dict:
+            full_prompt = await build_translate_prompt(user_input, request.translateType)
+            output_message, from_primary = await call_with_failover(agent, full_prompt, config)
+            translation = extract_translation(output_message)
+            # 备用后端的结果与缓存键中的模型不符，不写入缓存
+            if cache_key and translation and from_primary:
+                await rag_executor.run(translationCache.set, cache_key, translation)
+            return output_message
+
+        output_message = await inflight_translations.do(request_key, run_translation)
         logger.info(f"The output_message is: {output_message}")
         return output_message
 
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        logger.error(f"All backends unavailable: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error handling chat completion:\n\n {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post(Config.TRANSLATEAPI + "/batch")
+async def chat_translate_batch(request: BatchTranslateRequest, dependencies: Tuple[any] = Depends(get_dependencies)):
+    """批量翻译多个片段。
+
+    所有片段的 RAG 检索一次完成，随后在并发上限内并行调用模型，
+    结果按输入顺序返回，单个片段失败不影响其他片段。
+
+    Args:
+        request: 批量翻译请求参数。
+
+    Returns:
+        {"results": [{"index", "translation", "error"}, ...]}
+    """
+    try:
+        agent = dependencies
+        if not request.segments:
+            raise HTTPException(status_code=400, detail="Segments cannot be empty")
+        if len(request.segments) > Config.BATCH_MAX_SEGMENTS:
+            raise HTTPException(status_code=400, detail=f"Too many segments: at most {Config.BATCH_MAX_SEGMENTS} per batch")
+        direction_tip = get_direction_tip(request.translateType)
+        logger.info(f"Batch translation of {len(request.segments)} segments")
+
+        config = build_run_config(request)
+
+        # 先查翻译结果缓存，只对未命中的片段做检索和模型调用
+        request_keys, cached_results = await rag_executor.run(
+            lookup_cached_translations, request.segments, request.translateType
+        )
+
+        # 一次检索全部未命中片段，摊薄向量编码和 collection 查询开销
+        pending = [i for i, segment in enumerate(request.segments)
+                   if cached_results[i] is None and segment and segment.strip()]
+        pairs_by_index = dict(zip(
+            pending,
+            await rag_executor.run(
+                ragManager.retrieve_similar_pairs_batch,
+                queries=[request.segments[i] for i in pending],
+                n_results=3
+            )
+        ))
+
+        concurrency = request.maxConcurrency or Config.BATCH_MAX_CONCURRENCY
+        semaphore = asyncio.Semaphore(max(1, min(concurrency, Config.BATCH_MAX_CONCURRENCY)))
+
+        async def translate_segment(index: int, segment: str) -> dict:
+            if not segment or not segment.strip():
+                return {"index": index, "translation": None, "error": "Segment cannot be empty"}
+            if cached_results[index] is not None:
+                return {"index": index, "translation": cached_results[index], "error": None}
+            async def run_translation() -> dict:
+                prompt_text = format_rag_prompt(pairs_by_index[index]) + direction_tip + segment
+                output_message, from_primary = await call_with_failover(agent, prompt_text, config)
+                translation = extract_translation(output_message)
+                if Config.CACHE_ENABLED and translation and from_primary:
+                    await rag_executor.run(translationCache.set, request_keys[index], translation)
+                return output_message
+
+            async with semaphore:
+                try:
+                    # 批次内或跨请求的重复片段共享同一次模型调用
+                    output_message = await inflight_translations.do(request_keys[index], run_translation)
+                    return {"index": index, "translation": extract_translation(output_message), "error": None}
+                except Exception as e:
+                    logger.error(f"Error translating batch segment {index}: {e}")
+                    return {"index": index, "translation": None, "error": str(e)}
+
+        results = await asyncio.gather(
+            *(translate_segment(i, segment) for i, segment in enumerate(request.segments))
+        )
+        return {"results": list(results)}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error handling batch translation:\n\n {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # >>>>>>>>>>>> RAG 管理 API <<<<<<<<<<<<
 
 @app.get("/api/rag/collections")
@@ -253,30 +794,87 @@ async def get_collections():
         logger.error(f"获取知识库列表失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def submit_kb_job(file: UploadFile, mode: str) -> dict:
+    """
+    保存上传文件并提交知识库后台任务，返回任务信息。
+    """
+    upload_dir = tempfile.mkdtemp(prefix="kb_upload_")
+    try:
+        # 保存上传的文件，保留原文件名（决定 collection 名称），分块写入避免整体读入内存
+        file_path = os.path.join(upload_dir, os.path.basename(file.filename))
+        with open(file_path, "wb") as buffer:
+            while content := await file.read(1024 * 1024):
+                buffer.write(content)
+
+        # 提交任务，任务结束后删除临时目录
+        job = kbJobManager.submit(file_path, mode=mode, cleanup_dir=upload_dir)
+        return {**job.to_dict(), "message": "知识库任务已提交"}
+    except Exception as e:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        logger.error(f"提交知识库任务失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/rag/collections")
 async def create_collection(file: UploadFile = File(...)):
     """
-    上传文件并构建知识库
+    上传文件并提交后台构建任务，立即返回任务 ID，
+    通过 GET /api/rag/jobs/{job_id} 查询进度。
+    """
+    return await submit_kb_job(file, BUILD)
+
+@app.put("/api/rag/collections")
+async def upsert_collection(file: UploadFile = File(...)):
+    """
+    上传文件并提交增量同步任务：只编码新增或修改的句对，删除文件中已不存在的句对，
+    任务结果中包含新增、更新、删除、跳过的数量。
+    """
+    return await submit_kb_job(file, UPSERT)
+
+@app.delete("/api/rag/collections/{collection_name}/pairs")
+async def delete_collection_pairs(collection_name: str, request: DeletePairsRequest):
+    """
+    从指定知识库中删除句对
     """
     try:
-        # 保存上传的文件
-        # file_path = f"temp_{int(time.time())}_{file.filename}"
-        file_path = file.filename
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # 构建知识库
-        updated_list, message = ragManager.build_knowledge_base(file_path)
-        
-        # 删除临时文件
-        os.remove(file_path)
-        
-        return {"message": message}
+        deleted = await rag_executor.run(
+            ragManager.delete_pairs,
+            collection_name,
+            [(pair.source, pair.target) for pair in request.pairs]
+        )
+        return {"message": f"已删除 {deleted} 个句对", "deleted": deleted}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        logger.error(f"构建知识库失败: {e}")
+        logger.error(f"删除句对失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/rag/jobs")
+async def list_build_jobs():
+    """
+    获取全部知识库构建任务
+    """
+    return kbJobManager.list_jobs()
+
+@app.get("/api/rag/jobs/{job_id}")
+async def get_build_job(job_id: str):
+    """
+    查询知识库构建任务的状态与进度
+    """
+    job = kbJobManager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return job.to_dict()
+
+@app.delete("/api/rag/jobs/{job_id}")
+async def cancel_build_job(job_id: str):
+    """
+    取消知识库构建任务
+    """
+    job = kbJobManager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return job.to_dict()
+
 @app.delete("/api/rag/collections")
 async def delete_collections(request: DeleteCollectionsRequest):
     """
@@ -289,6 +887,27 @@ async def delete_collections(request: DeleteCollectionsRequest):
         logger.error(f"删除知识库失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# >>>>>>>>>>>> 监控 API <<<<<<<<<<<<
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """
+    获取运行时指标：翻译缓存命中率、请求合并情况等。
+    """
+    return {
+        "cache": translationCache.stats(),
+        "singleflight": inflight_translations.stats(),
+        "executors": {
+            rag_executor.name: rag_executor.stats(),
+            hf_executor.name: hf_executor.stats()
+        },
+        "hf_batcher": hf_batcher.stats() if hf_batcher is not None else None,
+        "llm_endpoints": {llm_type: llm_router.stats() for llm_type, llm_router in llm_routers.items()},
+        "breakers": {llm_type: breaker.stats() for llm_type, breaker in breakers.items()},
+        "hedging": hedger.stats() if hedger is not None else None,
+        "rag": ragManager.stats()
+    }
+
 if __name__ == "__main__":
     logger.info(f"Start the server on port {Config.PORT}")
     # uvicorn是一个用于运行ASGI应用的轻量级、超快速的ASGI服务器实现
@@ -0,0 +1,211 @@
+"""
+@File    : translation_cache.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/09/02 10:30
+"""
+
+"""
+翻译结果缓存模块：进程内 LRU + SQLite 持久化的两级缓存。
+缓存键由规范化原文、翻译方向、模型与知识库版本共同决定。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict
+
+from utils.config import Config
+from utils.text import normalize_text
+
+# 初始化日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TranslationCache:
+    """
+    两级翻译结果缓存。
+
+    - 一级：进程内 OrderedDict 实现的 LRU，按条目数淘汰。
+    - 二级：SQLite 文件，按 TTL 过期、按条目数淘汰最久未访问的记录。
+    """
+
+    # 每写入多少次磁盘记录检查一次容量，避免每次写入都做 COUNT(*)
+    EVICT_CHECK_INTERVAL = 100
+
+    def __init__(self, db_path: str, max_memory_entries: int, max_disk_entries: int, ttl_seconds: int):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "expired": 0,
+            "invalidations": 0,
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translation_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_translation_cache_accessed ON translation_cache (accessed_at)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(text: str, translate_type: str, llm_type: str, model_name: str, kb_version: str) -> str:
+        """
+        生成缓存键：对规范化原文、翻译方向、后端类型、模型名与知识库版本做哈希。
+        """
+        raw = json.dumps(
+            [normalize_text(text), translate_type, llm_type, model_name, kb_version],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        查询缓存，先查内存再查磁盘；磁盘命中时回填内存。
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._is_expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+                self._counters["expired"] += 1
+
+            try:
+                row = self._conn.execute(
+                    "SELECT value, created_at FROM translation_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created_at = row
+                    if not self._is_expired(created_at, now):
+                        self._conn.execute(
+                            "UPDATE translation_cache SET accessed_at = ? WHERE key = ?", (now, key)
+                        )
+                        self._conn.commit()
+                        self._put_memory(key, value, created_at)
+                        self._counters["disk_hits"] += 1
+                        return value
+                    self._conn.execute("DELETE FROM translation_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self._counters["expired"] += 1
+            except sqlite3.Error as e:
+                logger.warning(f"读取翻译缓存失败: {e}")
+
+            self._counters["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str):
+        """
+        写入缓存，同时写内存与磁盘。
+        """
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, value, now)
+            self._counters["sets"] += 1
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO translation_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                self._conn.commit()
+                self._writes_since_evict += 1
+                if self._writes_since_evict >= self.EVICT_CHECK_INTERVAL:
+                    self._writes_since_evict = 0
+                    self._evict_disk(now)
+            except sqlite3.Error as e:
+                logger.warning(f"写入翻译缓存失败: {e}")
+
+    def _put_memory(self, key: str, value: str, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _evict_disk(self, now: float):
+        """
+        清理过期记录，并在超出容量时按最久未访问淘汰。调用方需持有锁。
+        """
+        if self.ttl_seconds > 0:
+            cursor = self._conn.execute(
+                "DELETE FROM translation_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            self._counters["expired"] += cursor.rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM translation_cache").fetchone()[0]
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM translation_cache WHERE key IN "
+                "(SELECT key FROM translation_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            )
+            self._counters["evictions"] += overflow
+        self._conn.commit()
+
+    def clear(self):
+        """
+        清空全部缓存，在知识库变更时调用。
+        """
+        with self._lock:
+            self._memory.clear()
+            try:
+                self._conn.execute("DELETE FROM translation_cache")
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"清空翻译缓存失败: {e}")
+            self._counters["invalidations"] += 1
+        logger.info("知识库已变更，翻译缓存已清空")
+
+    def stats(self) -> Dict:
+        """
+        返回命中/未命中计数和当前容量，用于监控。
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+            stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+            stats["memory_entries"] = len(self._memory)
+            try:
+                stats["disk_entries"] = self._conn.execute("SELECT COUNT(*) FROM translation_cache").fetchone()[0]
+            except sqlite3.Error:
+                stats["disk_entries"] = None
+            return stats
+
+
+# 创建全局实例
+translationCache = TranslationCache(
+    db_path=Config.CACHE_DB_PATH,
+    max_memory_entries=Config.CACHE_MEMORY_MAX_ENTRIES,
+    max_disk_entries=Config.CACHE_DISK_MAX_ENTRIES,
+    ttl_seconds=Config.CACHE_TTL_SECONDS
+)
@@ -0,0 +1,121 @@
+import threading
+from typing import Dict, Iterable, List, Set
+
+"""
+@File    : aho_corasick.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/9/16 14:00
+"""
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick 多模式匹配自动机。
+
+    一次扫描即可找出文本中出现的全部模式串，耗时为 O(len(text) + 匹配数)，
+    与模式串数量无关。增删模式串只修改 trie 并标记失效，
+    失败指针在下一次查询时重新计算。
+    """
+
+    def __init__(self, patterns: Iterable[str] = ()):
+        # 节点 i 的转移表、失败指针、以该节点结尾的模式串、最近的带输出后缀节点
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[str]] = [set()]
+        self._dict_link: List[int] = [-1]
+        self._size = 0
+        self._built = False
+        self._lock = threading.Lock()
+        for pattern in patterns:
+            self.add(pattern)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, pattern: str):
+        """增加一个模式串"""
+        if not pattern:
+            return
+        with self._lock:
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto.append({})
+                    self._output.append(set())
+                    self._goto[node][char] = next_node
+                node = next_node
+            if pattern not in self._output[node]:
+                self._output[node].add(pattern)
+                self._size += 1
+                self._built = False
+
+    def remove(self, pattern: str):
+        """删除一个模式串，trie 节点保留，仅清除输出"""
+        with self._lock:
+            node = 0
+            for char in pattern:
+                node = self._goto[node].get(char)
+                if node is None:
+                    return
+            if pattern in self._output[node]:
+                self._output[node].discard(pattern)
+                self._size -= 1
+                self._built = False
+
+    def _build(self):
+        """按 BFS 计算失败指针与输出后缀链接，完成后整体替换"""
+        count = len(self._goto)
+        fail = [0] * count
+        dict_link = [-1] * count
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in self._goto[state]:
+                    state = fail[state]
+                target = self._goto[state].get(char, 0)
+                fail[child] = target if target != child else 0
+                dict_link[child] = fail[child] if self._output[fail[child]] else dict_link[fail[child]]
+        self._fail = fail
+        self._dict_link = dict_link
+        self._built = True
+
+    def find_all(self, text: str) -> Set[str]:
+        """
+        返回 text 中出现的全部模式串
+
+        Args:
+            text (str): 待匹配文本
+
+        Returns:
+            Set[str]: 出现过的模式串集合
+        """
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._build()
+        goto, fail, output, dict_link = self._goto, self._fail, self._output, self._dict_link
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if node >= len(fail):
+                # 查询期间有新模式串插入，新节点尚无失败指针，本次从根重新开始
+                node = 0
+                continue
+            if output[node]:
+                found.update(output[node])
+            link = dict_link[node]
+            while link > 0:
+                found.update(output[link])
+                link = dict_link[link]
+        return found
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+"""
+@File    : circuit_breaker.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/9/10 15:30
+"""
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被直接拒绝"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    LLM 后端熔断器。
+
+    最近 window_size 次调用中，失败（异常、超时或耗时超过 slow_call_seconds）占比
+    达到 failure_rate_threshold 时熔断打开，此后 open_seconds 秒内直接拒绝调用；
+    到期后进入半开状态，放行少量探测请求，探测成功则关闭，失败则重新打开。
+    """
+
+    def __init__(
+            self,
+            name: str,
+            failure_rate_threshold: float = 0.5,
+            window_size: int = 20,
+            min_calls: int = 5,
+            slow_call_seconds: float = 15.0,
+            open_seconds: float = 30.0,
+            half_open_max_calls: int = 1
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._outcomes = deque(maxlen=window_size)
+        self._counters = {"successes": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self):
+        # 调用方需持有锁：打开时间到期后转为半开
+        if self._state == OPEN and time.time() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+            logger.info(f"熔断器 {self.name} 进入半开状态，开始探测")
+
+    def acquire(self) -> bool:
+        """
+        判断是否放行一次调用；放行后必须调用 record 或 release
+
+        Returns:
+            bool: True 表示放行
+        """
+        with self._lock:
+            self._refresh_state()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+            self._counters["rejected"] += 1
+            return False
+
+    def release(self):
+        """放行的调用被取消、没有结果时归还半开探测名额"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record(self, success: bool, latency: Optional[float] = None):
+        """
+        记录一次调用结果
+
+        Args:
+            success (bool): 调用是否成功
+            latency (float, optional): 调用耗时（秒），超过慢调用阈值时按失败计
+        """
+        with self._lock:
+            if success and latency is not None and latency > self.slow_call_seconds:
+                success = False
+                self._counters["slow_calls"] += 1
+            self._counters["successes" if success else "failures"] += 1
+
+            if self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if success:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    logger.info(f"熔断器 {self.name} 探测成功，恢复关闭状态")
+                else:
+                    self._trip()
+                return
+
+            self._outcomes.append(success)
+            if self._state == CLOSED and len(self._outcomes) >= self.min_calls:
+                failure_rate = self._outcomes.count(False) / len(self._outcomes)
+                if failure_rate >= self.failure_rate_threshold:
+                    self._trip()
+
+    def _trip(self):
+        # 调用方需持有锁
+        self._state = OPEN
+        self._opened_at = time.time()
+        self._outcomes.clear()
+        self._counters["opened"] += 1
+        logger.warning(f"熔断器 {self.name} 已打开，{self.open_seconds}s 内直接拒绝调用")
+
+    async def call(self, factory: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """
+        在熔断器保护下执行一次异步调用
+
+        Args:
+            factory (Callable): 无参函数，返回要执行的协程
+            timeout (float, optional): 单次调用超时（秒），超时按失败计
+
+        Returns:
+            Any: 调用结果
+
+        Raises:
+            CircuitOpenError: 熔断器打开时直接抛出
+        """
+        if not self.acquire():
+            raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+        started_at = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(factory(), timeout)
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except Exception:
+            self.record(False)
+            raise
+        self.record(True, time.perf_counter() - started_at)
+        return result
+
+    def stats(self) -> Dict:
+        """返回熔断器状态与计数，用于监控"""
+        with self._lock:
+            self._refresh_state()
+            stats = dict(self._counters)
+            stats["state"] = self._state
+            stats["window_failure_rate"] = (
+                round(self._outcomes.count(False) / len(self._outcomes), 3) if self._outcomes else 0.0
+            )
+            return stats
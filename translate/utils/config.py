@@ -22,7 +22,98 @@ class Config:
     # openai:调用gpt模型
     LLM_TYPE = "chatglm"
 
+    # 运行时故障切换：主后端熔断或失败时使用的备用后端，None 表示不切换
+    FALLBACK_LLM_TYPE = None
+
+    # 熔断器：单次调用超时、统计窗口、触发熔断的失败率、慢调用阈值与熔断持续时间（秒）
+    # 超时只在还有备用后端可切换时生效，None 表示不限制；本地 HuggingFace 推理无法中途取消，不设超时
+    LLM_CALL_TIMEOUT = None
+    BREAKER_WINDOW_SIZE = 20
+    BREAKER_MIN_CALLS = 5
+    BREAKER_FAILURE_RATE = 0.5
+    BREAKER_SLOW_CALL_SECONDS = 15
+    BREAKER_OPEN_SECONDS = 30
+
+    # 对冲请求：首 token 超过历史延迟的该分位数仍未到达时，向其他端点/备用后端发出重复请求
+    # HEDGE_MAX_RATIO 限制对冲请求占总请求的比例，样本不足时使用 HEDGE_INITIAL_DELAY（秒）
+    HEDGE_ENABLED = False
+    HEDGE_PERCENTILE = 0.95
+    HEDGE_MAX_RATIO = 0.1
+    HEDGE_INITIAL_DELAY = 2.0
+    HEDGE_MIN_DELAY = 0.05
+
+    # 执行模式：agent 使用 LangGraph react agent，direct 直接调用聊天模型（更低开销）
+    EXECUTION_MODE = "agent"
+
     # API服务地址和端口
     HOST = "0.0.0.0"
     PORT = 8012
-    TRANSLATEAPI = "/v1/chat/translate"
\ No newline at end of file
+    TRANSLATEAPI = "/v1/chat/translate"
+
+    # 批量翻译：单次请求最大片段数、并发调用模型的上限
+    BATCH_MAX_SEGMENTS = 1000
+    BATCH_MAX_CONCURRENCY = 8
+
+    # 阻塞阶段的专用线程池大小：RAG 检索、本地 HuggingFace 推理
+    RAG_EXECUTOR_WORKERS = 4
+    HF_EXECUTOR_WORKERS = 1
+
+    # 本地 HuggingFace 模型微批：单批最大提示词数、凑批最长等待毫秒数
+    HF_BATCH_ENABLED = True
+    HF_MAX_BATCH_SIZE = 8
+    HF_BATCH_WAIT_MS = 10
+
+    # 向量模型推理后端：torch 为 SentenceTransformer 默认的 PyTorch 推理，
+    # onnx-int8 为导出并 int8 动态量化后的 ONNX Runtime 推理（CPU）
+    # 量化指令集可选 arm64 / avx2 / avx512 / avx512_vnni，线程数为 0 时由 ONNX Runtime 自动决定
+    # 切换后端不会重新编码已有知识库中的向量，启动时对不一致的知识库给出警告，需删除后重新构建
+    EMBEDDING_BACKEND = "torch"
+    EMBEDDING_ONNX_QUANTIZATION = "avx2"
+    EMBEDDING_ONNX_THREADS = 0
+
+    # 语义检索后端：chroma 直接查询 ChromaDB；memmap 将知识库导出为内存映射矩阵后用 NumPy 精确检索，
+    # 适合读多写少、多个 worker 进程共享同一份向量的场景。向量可存为 float32 或 float16
+    VECTOR_STORE_BACKEND = "chroma"
+    VECTOR_STORE_DTYPE = "float32"
+    # memmap 后端的向量压缩：none 不压缩；sq8 为 int8 标量量化（常驻内存约 1/4）；
+    # pq 为乘积量化，每个向量 VECTOR_STORE_PQ_SUBVECTORS 字节（需整除向量维度 384）。
+    # 压缩时先在码字上取 k * VECTOR_STORE_RERANK_FACTOR 个候选，再读取原始向量精确重排
+    VECTOR_STORE_COMPRESSION = "none"
+    VECTOR_STORE_PQ_SUBVECTORS = 48
+    VECTOR_STORE_RERANK_FACTOR = 10
+    # memmap 后端的存储目录
+    VECTOR_STORE_DIR = "./vector_store"
+
+    # 检查 ChromaDB 文件是否被其他进程修改的最小间隔（秒），0 表示不检查
+    KB_REGISTRY_WATCH_INTERVAL = 5
+
+    # 持久化向量库：按 (模型 ID, 文本哈希) 复用构建知识库时计算过的向量
+    EMBEDDING_STORE_ENABLED = True
+    EMBEDDING_STORE_DIR = "./embedding_store"
+
+    # 查询向量 LRU 缓存的内存上限（字节）
+    EMBEDDING_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+    # 查询向量跨请求微批：单批最大文本数与首条文本到达后的最长等待时间（毫秒）
+    EMBED_BATCH_ENABLED = True
+    EMBED_MAX_BATCH_SIZE = 64
+    EMBED_BATCH_WAIT_MS = 5
+
+    # 构建知识库时每次读取的 CSV 行数、向量编码批大小与单次写入 ChromaDB 的最大条目数
+    KB_CSV_CHUNK_ROWS = 10000
+    KB_ENCODE_BATCH_SIZE = 64
+    KB_CHROMA_ADD_BATCH_SIZE = 5000
+
+    # 混合检索：关键词、BM25、语义三路候选用倒数排名融合（RRF）合并，
+    # RRF_K 越大，各路排名靠后的候选与靠前的差距越小；每路最多取 RAG_RRF_CANDIDATES 个候选
+    RAG_RRF_K = 60
+    RAG_RRF_CANDIDATES = 10
+    # BM25 候选的 source 中至少有该比例的词出现在查询里，避免只因常见词重合而召回
+    RAG_BM25_MIN_COVERAGE = 0.6
+
+    # 翻译结果缓存：内存 LRU 条目数、SQLite 持久化条目数与过期时间（秒）
+    CACHE_ENABLED = True
+    CACHE_DB_PATH = os.path.join(LOG_DIR, "translation_cache.sqlite3")
+    CACHE_MEMORY_MAX_ENTRIES = 10000
+    CACHE_DISK_MAX_ENTRIES = 200000
+    CACHE_TTL_SECONDS = 7 * 24 * 3600
\ No newline at end of file
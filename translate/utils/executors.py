@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable
+
+"""
+@File    : executors.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/9/4 09:40
+"""
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class StageExecutor:
+    """
+    为某个阻塞阶段（RAG 检索、本地模型推理等）提供独立线程池，
+    让同步调用离开 asyncio 事件循环，并统计排队深度与耗时。
+
+    SentenceTransformer、Chroma 和 PyTorch 推理在计算时都会释放 GIL，
+    因此线程池即可让并发请求真正重叠执行。
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._max_queued = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在线程池中执行同步函数并等待结果
+
+        Args:
+            fn (Callable): 要执行的同步函数
+            *args, **kwargs: 传递给 fn 的参数
+
+        Returns:
+            Any: fn 的返回值，异常原样抛出
+        """
+        submitted_at = time.perf_counter()
+        with self._lock:
+            self._submitted += 1
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+
+        def task():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                self._total_wait += started_at - submitted_at
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._total_run += time.perf_counter() - started_at
+                    if failed:
+                        self._failed += 1
+                    else:
+                        self._completed += 1
+
+        future = self._executor.submit(task)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # 等待方被取消时，尚未开始执行的任务会被一并取消，需要修正排队计数
+            if future.cancelled():
+                with self._lock:
+                    self._queued -= 1
+            raise
+
+    async def stream(self, fn: Callable[..., Iterable], *args, **kwargs) -> AsyncIterator:
+        """
+        在线程池中消费同步迭代器，并逐个产出其中的元素
+
+        Args:
+            fn (Callable): 返回同步迭代器的函数
+            *args, **kwargs: 传递给 fn 的参数
+
+        Yields:
+            Any: 迭代器产出的元素，迭代过程中的异常原样抛出
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        finished = object()
+        stopped = threading.Event()
+
+        def produce():
+            try:
+                for item in fn(*args, **kwargs):
+                    # 调用方提前退出时停止消费，释放线程
+                    if stopped.is_set():
+                        return
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+        task = asyncio.ensure_future(self.run(produce))
+        # 调用方提前退出后不再等待该任务，这里取走其异常避免未处理告警
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                yield item
+            await task
+        finally:
+            stopped.set()
+
+    def stats(self) -> Dict:
+        """返回队列深度、活跃线程数与平均等待/执行耗时"""
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self._queued,
+                "max_queue_depth": self._max_queued,
+                "active": self._active,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_wait_ms": round(self._total_wait / finished * 1000, 2) if finished else 0.0,
+                "avg_run_ms": round(self._total_run / finished * 1000, 2) if finished else 0.0,
+            }
+
+    def shutdown(self):
+        """关闭线程池，不等待排队中的任务"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        logger.info(f"执行器 {self.name} 已关闭")
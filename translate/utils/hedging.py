@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, Tuple
+
+"""
+@File    : hedging.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/9/12 10:15
+"""
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 保留最近多少次首 token 延迟用于计算分位数
+LATENCY_WINDOW = 500
+# 样本数不足时使用固定的初始延迟
+MIN_SAMPLES = 20
+
+
+class Hedger:
+    """
+    对冲请求：主请求在“首 token 延迟的 p 分位数”内仍未产出首个 token 时，
+    向另一个端点或后端发出相同请求，先完成者胜出，另一个被取消。
+
+    对冲次数由令牌桶限制：每个请求累积 max_hedge_ratio 个令牌，每次对冲消耗 1 个，
+    因此长期对冲比例不会超过 max_hedge_ratio。
+    """
+
+    def __init__(
+            self,
+            percentile: float = 0.95,
+            max_hedge_ratio: float = 0.1,
+            initial_delay: float = 2.0,
+            min_delay: float = 0.05,
+            max_burst: float = 10.0
+    ):
+        self.percentile = percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_burst = max_burst
+
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._tokens = 0.0
+        self._requests = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._budget_denied = 0
+
+    def current_delay(self) -> float:
+        """返回当前的对冲触发延迟（秒）"""
+        if len(self._latencies) < MIN_SAMPLES:
+            return self.initial_delay
+        latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile))
+        return max(self.min_delay, latencies[index])
+
+    async def _consume(self, factory: Callable[[], AsyncIterator[str]], started_at: float, record: bool,
+                       first_token: asyncio.Event) -> str:
+        parts = []
+        async for token in factory():
+            if not first_token.is_set():
+                first_token.set()
+                if record:
+                    self._latencies.append(time.perf_counter() - started_at)
+            parts.append(token)
+        return "".join(parts)
+
+    async def run(self, primary: Callable[[], AsyncIterator[str]],
+                  hedge: Callable[[], AsyncIterator[str]]) -> Tuple[str, int]:
+        """
+        执行一次可能被对冲的流式调用
+
+        Args:
+            primary (Callable): 无参函数，返回主请求的 token 异步迭代器
+            hedge (Callable): 无参函数，返回对冲请求的 token 异步迭代器
+
+        Returns:
+            Tuple[str, int]: (完整文本, 胜出者序号)，0 为主请求，1 为对冲请求
+        """
+        self._requests += 1
+        self._tokens = min(self.max_burst, self._tokens + self.max_hedge_ratio)
+
+        first_token = asyncio.Event()
+        tasks = [asyncio.create_task(self._consume(primary, time.perf_counter(), True, first_token))]
+        first_token_wait = asyncio.create_task(first_token.wait())
+        try:
+            done, _ = await asyncio.wait(
+                [tasks[0], first_token_wait],
+                timeout=self.current_delay(),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            # 超过延迟仍既没有首 token 也没有结束，视为掉队请求
+            if not done:
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self._hedges += 1
+                    logger.info(f"首 token 超过 {self.current_delay():.3f}s 未到达，发出对冲请求")
+                    tasks.append(asyncio.create_task(
+                        self._consume(hedge, time.perf_counter(), False, asyncio.Event())
+                    ))
+                else:
+                    self._budget_denied += 1
+
+            pending = set(tasks)
+            last_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = tasks.index(task)
+                        if winner == 1:
+                            self._hedge_wins += 1
+                        return task.result(), winner
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            first_token_wait.cancel()
+            # 取消落败或仍在运行的请求
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict:
+        """返回对冲次数、比例与当前触发延迟"""
+        return {
+            "requests": self._requests,
+            "hedges": self._hedges,
+            "hedge_rate": round(self._hedges / self._requests, 4) if self._requests else 0.0,
+            "hedge_wins": self._hedge_wins,
+            "budget_denied": self._budget_denied,
+            "current_delay_ms": round(self.current_delay() * 1000, 1),
+        }
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+
+from utils.executors import StageExecutor
+
+"""
+@File    : hf_batcher.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/9/8 11:05
+"""
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class HFMicroBatcher:
+    """
+    本地 HuggingFace 模型的动态微批调度器。
+
+    并发请求的提示词先进入等待队列，调度器等待最多 max_wait_ms 毫秒或凑满
+    max_batch_size 条后，以一个左填充的批次送入 text-generation pipeline，
+    再把每条生成结果交还给对应的等待者。
+    """
+
+    def __init__(self, llm, executor: StageExecutor, max_batch_size: int = 8, max_wait_ms: float = 10):
+        """
+        Args:
+            llm (HuggingFacePipeline): 包含 text-generation pipeline 的模型实例
+            executor (StageExecutor): 执行同步推理的线程池
+            max_batch_size (int): 单批最大提示词数量
+            max_wait_ms (float): 首条提示词到达后最多等待的毫秒数
+        """
+        self.pipeline = llm.pipeline
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+
+        # 因果语言模型批量生成需要左填充，且必须有 pad token
+        tokenizer = self.pipeline.tokenizer
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+
+        self._pending = deque()
+        self._has_items: Optional[asyncio.Event] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._batches = 0
+        self._prompts = 0
+
+    def _ensure_worker(self):
+        # Event 与 Task 需要在运行中的事件循环里创建
+        if self._worker is None or self._worker.done():
+            self._has_items = asyncio.Event()
+            self._batch_full = asyncio.Event()
+            if self._pending:
+                self._has_items.set()
+            self._worker = asyncio.create_task(self._run())
+
+    async def submit(self, prompt: str) -> str:
+        """
+        提交一条提示词，等待所在批次完成后返回生成的文本
+
+        Args:
+            prompt (str): 完整提示词
+
+        Returns:
+            str: 模型生成的文本（不含提示词本身）
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((prompt, future))
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._batch_full.set()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._has_items.wait()
+
+            # 从第一条提示词到达开始计时，凑满批次或超时后立即执行
+            deadline = loop.time() + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._batch_full.clear()
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = []
+            while self._pending and len(batch) < self.max_batch_size:
+                prompt, future = self._pending.popleft()
+                # 跳过已被调用方取消的请求
+                if not future.done():
+                    batch.append((prompt, future))
+            if not self._pending:
+                self._has_items.clear()
+            if not batch:
+                continue
+
+            self._batches += 1
+            self._prompts += len(batch)
+            try:
+                outputs = await self.executor.run(self._generate, [prompt for prompt, _ in batch])
+                for (_, future), text in zip(batch, outputs):
+                    if not future.done():
+                        future.set_result(text)
+            except Exception as e:
+                logger.error(f"HuggingFace 批量推理失败: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _generate(self, prompts: List[str]) -> List[str]:
+        outputs = self.pipeline(prompts, batch_size=len(prompts), return_full_text=False)
+        return [output[0]["generated_text"] for output in outputs]
+
+    def stats(self) -> Dict:
+        """返回批次数、平均批大小与当前等待数"""
+        return {
+            "batches": self._batches,
+            "prompts": self._prompts,
+            "avg_batch_size": round(self._prompts / self._batches, 2) if self._batches else 0.0,
+            "pending": len(self._pending),
+        }
+
+    def shutdown(self):
+        """停止调度器"""
+        if self._worker is not None:
+            self._worker.cancel()
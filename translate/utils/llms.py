@@ -1,6 +1,14 @@
 import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
 from langchain_openai import ChatOpenAI,OpenAIEmbeddings
 from langchain_huggingface import HuggingFacePipeline
+from langchain_core.language_models.chat_models import BaseChatModel
+import httpx
 import logging
 from dotenv import load_dotenv
 import torch
@@ -22,6 +30,15 @@ logger = logging.getLogger(__name__)
 
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 
+
+def parse_base_urls(env_name: str, default_url: str) -> List[str]:
+    """
+    从逗号分隔的环境变量中读取多个 OpenAI 兼容端点，未配置时使用单个默认端点
+    """
+    urls = os.getenv(env_name, "")
+    return [url.strip() for url in urls.split(",") if url.strip()] or [default_url]
+
+
 # 模型配置字典从环境变量读取
 MODEL_CONFIGS = {
     "ollama": {
@@ -42,16 +59,269 @@ MODEL_CONFIGS = {
 }
 
 
+# 多端点配置：OLLAMA_BASE_URLS / CHATGLM_BASE_URLS 为逗号分隔的端点列表
+MODEL_CONFIGS["ollama"]["base_urls"] = parse_base_urls("OLLAMA_BASE_URLS", MODEL_CONFIGS["ollama"]["base_url"])
+MODEL_CONFIGS["chatglm"]["base_urls"] = parse_base_urls("CHATGLM_BASE_URLS", MODEL_CONFIGS["chatglm"]["base_url"])
+
+
 # 默认配置
 DEFAULT_LLM_TYPE = "ollama"
 DEFAULT_TEMPERATURE = 0.6
 
+# 多端点路由：健康检查间隔（秒）、连续失败多少次后摘除、摘除后多久允许重新尝试（秒）
+HEALTH_CHECK_INTERVAL = float(os.getenv("LLM_HEALTH_CHECK_INTERVAL", "10"))
+EJECT_AFTER_FAILURES = int(os.getenv("LLM_EJECT_AFTER_FAILURES", "3"))
+EJECT_SECONDS = float(os.getenv("LLM_EJECT_SECONDS", "30"))
+# 健康检查请求的路径（相对 base_url），不提供 /models 的服务可改为其他轻量接口
+HEALTH_CHECK_PATH = os.getenv("LLM_HEALTH_CHECK_PATH", "/models")
+# 保留最近多少次调用耗时用于计算分位数
+LATENCY_WINDOW = 200
+
+
+class RoutingScope:
+    """
+    一次模型调用的路由记录：调用方可指定需避开的端点，路由器把实际使用的端点写回。
+    对冲请求用它避开主请求所在的端点。
+    """
+
+    def __init__(self, exclude: Optional["LLMEndpoint"] = None):
+        self.exclude = exclude
+        self.endpoint: Optional["LLMEndpoint"] = None
+
+
+# 当前任务的路由记录，每个 asyncio 任务拥有独立的上下文
+_routing_scope: ContextVar[Optional[RoutingScope]] = ContextVar("llm_routing_scope", default=None)
+
+
+def enter_routing_scope(scope: RoutingScope) -> RoutingScope:
+    """在当前上下文（任务）中启用路由记录，之后该任务内的多端点调用都会使用它"""
+    _routing_scope.set(scope)
+    return scope
+
 
 class LLMInitializationError(Exception):
     """自定义异常类用于LLM初始化错误"""
     pass
 
 
+class LLMEndpoint:
+    """单个 OpenAI 兼容端点及其运行状态"""
+
+    def __init__(self, base_url: str, api_key: str, llm: ChatOpenAI):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.llm = llm
+        self.in_flight = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejected_at = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.last_error = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def stats(self) -> Dict:
+        latencies = sorted(self.latencies)
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+            "latency_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1) if latencies else None,
+        }
+
+
+class LLMRouter:
+    """
+    多端点路由器：每次调用选择进行中请求最少的健康端点。
+
+    连续失败达到阈值的端点会被摘除，之后由后台健康检查或冷却时间到期后恢复。
+    """
+
+    def __init__(self, endpoints: List[LLMEndpoint]):
+        self.endpoints = endpoints
+        self._lock = threading.Lock()
+        self._health_task: Optional[asyncio.Task] = None
+
+    def acquire(self, exclude: Optional[LLMEndpoint] = None) -> LLMEndpoint:
+        """
+        选择一个端点并占用一个进行中名额
+
+        Args:
+            exclude (LLMEndpoint, optional): 尽量避开的端点（如对冲请求时避开主请求所在端点）
+
+        Returns:
+            LLMEndpoint: 选中的端点
+        """
+        with self._lock:
+            self._recover_expired()
+            candidates = [e for e in self.endpoints if e.healthy and e is not exclude]
+            if not candidates:
+                candidates = [e for e in self.endpoints if e.healthy] or self.endpoints
+            endpoint = min(candidates, key=lambda e: (e.in_flight, e.consecutive_failures))
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def has_alternative(self, exclude: Optional[LLMEndpoint]) -> bool:
+        """除 exclude 外是否还有健康端点"""
+        with self._lock:
+            self._recover_expired()
+            return any(e.healthy and e is not exclude for e in self.endpoints)
+
+    def _recover_expired(self):
+        # 调用方需持有锁。冷却时间到期的摘除端点允许再次尝试（半恢复）
+        now = time.time()
+        for endpoint in self.endpoints:
+            if not endpoint.healthy and now - endpoint.ejected_at >= EJECT_SECONDS:
+                endpoint.healthy = True
+                logger.info(f"端点冷却结束，重新加入路由: {endpoint.base_url}")
+
+    def release(self, endpoint: LLMEndpoint, latency: Optional[float] = None, error: Optional[Exception] = None):
+        """
+        释放端点名额并记录结果
+
+        Args:
+            endpoint (LLMEndpoint): acquire 返回的端点
+            latency (float, optional): 成功调用的耗时（秒），被取消的调用不记录
+            error (Exception, optional): 调用失败时的异常
+        """
+        with self._lock:
+            endpoint.in_flight -= 1
+            if error is not None:
+                endpoint.errors += 1
+                endpoint.last_error = str(error)
+                self._mark_failure(endpoint)
+            elif latency is not None:
+                # 真实调用成功说明端点可用，同时清零健康检查累计的失败次数
+                endpoint.latencies.append(latency)
+                endpoint.consecutive_failures = 0
+
+    def _mark_failure(self, endpoint: LLMEndpoint):
+        # 调用方需持有锁
+        endpoint.consecutive_failures += 1
+        if endpoint.healthy and endpoint.consecutive_failures >= EJECT_AFTER_FAILURES:
+            endpoint.healthy = False
+            endpoint.ejected_at = time.time()
+            logger.warning(f"端点连续失败 {endpoint.consecutive_failures} 次，已摘除: {endpoint.base_url}")
+
+    async def _check_endpoint(self, client: httpx.AsyncClient, endpoint: LLMEndpoint):
+        try:
+            response = await client.get(
+                f"{endpoint.base_url.rstrip('/')}/{HEALTH_CHECK_PATH.lstrip('/')}",
+                headers={"Authorization": f"Bearer {endpoint.api_key}"}
+            )
+            # 4xx 说明服务可达，只是不支持该路径或鉴权方式不同；只有连接失败、超时与 5xx 计为失败
+            if response.status_code >= 500:
+                response.raise_for_status()
+            with self._lock:
+                if not endpoint.healthy:
+                    logger.info(f"端点健康检查通过，恢复路由: {endpoint.base_url}")
+                endpoint.healthy = True
+                endpoint.consecutive_failures = 0
+        except Exception as e:
+            with self._lock:
+                endpoint.last_error = f"health check: {e}"
+                self._mark_failure(endpoint)
+
+    async def _health_loop(self):
+        async with httpx.AsyncClient(timeout=5) as client:
+            while True:
+                await asyncio.gather(*(self._check_endpoint(client, e) for e in self.endpoints))
+                await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+    def start_health_checks(self):
+        """在当前事件循环中启动后台健康检查"""
+        if HEALTH_CHECK_INTERVAL > 0 and (self._health_task is None or self._health_task.done()):
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    def stop_health_checks(self):
+        """停止后台健康检查"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [endpoint.stats() for endpoint in self.endpoints]
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    将调用分发到多个 OpenAI 兼容端点的聊天模型，对 LangGraph 与直连模式透明。
+    """
+
+    router: Any = None
+    model_name: str = ""
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-openai"
+
+    def _acquire(self) -> LLMEndpoint:
+        """按当前任务的路由记录选择端点，并把选中的端点写回记录"""
+        scope = _routing_scope.get()
+        endpoint = self.router.acquire(exclude=scope.exclude if scope is not None else None)
+        if scope is not None:
+            scope.endpoint = endpoint
+        return endpoint
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        endpoint = self._acquire()
+        started_at = time.perf_counter()
+        try:
+            result = endpoint.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        except Exception as e:
+            self.router.release(endpoint, error=e)
+            raise
+        self.router.release(endpoint, latency=time.perf_counter() - started_at)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        endpoint = self._acquire()
+        started_at = time.perf_counter()
+        latency, error = None, None
+        try:
+            result = await endpoint.llm._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            latency = time.perf_counter() - started_at
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.router.release(endpoint, latency=latency, error=error)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        endpoint = self._acquire()
+        started_at = time.perf_counter()
+        latency, error = None, None
+        try:
+            yield from endpoint.llm._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            latency = time.perf_counter() - started_at
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.router.release(endpoint, latency=latency, error=error)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        endpoint = self._acquire()
+        started_at = time.perf_counter()
+        latency, error = None, None
+        try:
+            async for chunk in endpoint.llm._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
+            latency = time.perf_counter() - started_at
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.router.release(endpoint, latency=latency, error=error)
+
+
 def initialize_huggingface_llm(config):
     """
     初始化HuggingFace模型实例
@@ -96,6 +366,8 @@ def initialize_huggingface_llm(config):
             model=model,
             tokenizer=tokenizer,
             max_new_tokens=512,
+            # 只返回新生成的文本，与流式输出和批量推理保持一致
+            return_full_text=False,
             temperature=DEFAULT_TEMPERATURE,
             do_sample=True,
             device=0 if device == "cuda" and torch.cuda.is_available() else -1
@@ -139,15 +411,25 @@ def initialize_llm(llm_type: str = DEFAULT_LLM_TYPE) -> tuple[ChatOpenAI]:
         if llm_type == "ollama":
             os.environ["OPENAI_API_KEY"] = "NA"
 
-        # 创建LLM实例
-        llm_chat = ChatOpenAI(
-            base_url=config["base_url"],
-            api_key=config["api_key"],
-            model=config["chat_model"],
-            temperature=DEFAULT_TEMPERATURE,
-            timeout=30,  # 添加超时配置（秒）
-            max_retries=2  # 添加重试次数
-        )
+        # 创建LLM实例，每个端点一个 ChatOpenAI
+        endpoints = []
+        for base_url in config["base_urls"]:
+            llm = ChatOpenAI(
+                base_url=base_url,
+                api_key=config["api_key"],
+                model=config["chat_model"],
+                temperature=DEFAULT_TEMPERATURE,
+                timeout=30,  # 添加超时配置（秒）
+                max_retries=2  # 添加重试次数
+            )
+            endpoints.append(LLMEndpoint(base_url, config["api_key"], llm))
+
+        if len(endpoints) == 1:
+            llm_chat = endpoints[0].llm
+        else:
+            # 多个端点时按最少进行中请求路由
+            llm_chat = RoutedChatModel(router=LLMRouter(endpoints), model_name=config["chat_model"])
+            logger.info(f"{llm_type} 配置了 {len(endpoints)} 个端点，启用多端点路由")
 
         # llm_embedding = OpenAIEmbeddings(
         #     base_url=config["base_url"],
@@ -186,6 +468,31 @@ def get_llm(llm_type: str = DEFAULT_LLM_TYPE) -> ChatOpenAI:
         raise  # 如果默认配置也失败，则抛出异常
 
 
+def get_model_name(llm) -> str:
+    """
+    获取LLM实例实际使用的模型名称
+
+    Args:
+        llm (Union[ChatOpenAI, HuggingFacePipeline]): LLM实例
+
+    Returns:
+        str: 模型名称，无法识别时返回 'unknown'
+    """
+    # HuggingFacePipeline 从 pipeline 的模型中读取，ChatOpenAI 使用 model_name
+    if hasattr(llm, "pipeline"):
+        name = getattr(llm.pipeline.model, "name_or_path", None) or getattr(llm, "model_id", None)
+    else:
+        name = getattr(llm, "model_name", None)
+    return name or "unknown"
+
+
+def get_llm_router(llm) -> Optional[LLMRouter]:
+    """
+    返回多端点模型的路由器，单端点模型返回 None
+    """
+    return llm.router if isinstance(llm, RoutedChatModel) else None
+
+
 # 示例使用
 if __name__ == "__main__":
     try:
@@ -0,0 +1,142 @@
+import numpy as np
+
+"""
+@File    : quantization.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/9/29 10:00
+"""
+
+# 乘积量化每个子空间的码本大小，码字用 uint8 存储
+PQ_CENTROIDS = 256
+# 训练 k-means 的迭代次数
+PQ_ITERATIONS = 20
+
+
+class ScalarQuantizer:
+    """
+    int8 标量量化：每个维度按训练样本的最小/最大值线性映射到 0~255，
+    内积由码字直接计算：q·x ≈ codes·(q ⊙ scale) + q·low，内存为 float32 的 1/4。
+    """
+
+    kind = "sq8"
+
+    def __init__(self, low: np.ndarray, scale: np.ndarray):
+        self.low = np.asarray(low, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+
+    @classmethod
+    def train(cls, sample: np.ndarray) -> "ScalarQuantizer":
+        sample = np.asarray(sample, dtype=np.float32)
+        low = sample.min(axis=0)
+        high = sample.max(axis=0)
+        scale = np.maximum(high - low, 1e-8) / 255.0
+        return cls(low, scale)
+
+    def code_size(self) -> int:
+        return self.low.shape[0]
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def prepare(self, query_units: np.ndarray):
+        """预先计算与码字无关的查询项"""
+        return query_units * self.scale, query_units @ self.low
+
+    def inner_products(self, prepared, codes: np.ndarray) -> np.ndarray:
+        """返回 (m, B) 的近似内积"""
+        scaled, bias = prepared
+        return scaled @ codes.astype(np.float32).T + bias[:, None]
+
+    def save(self, path: str):
+        np.savez(path, kind=self.kind, low=self.low, scale=self.scale)
+
+
+class ProductQuantizer:
+    """
+    乘积量化：向量切分为 M 个子向量，每个子空间用 k-means 训练 256 个中心，
+    每个向量只存 M 个 uint8 码字。检索时先算查询与各中心的内积查找表（ADC），
+    再按码字查表累加，内存为 float32 的 4·dim/M 分之一。
+    """
+
+    kind = "pq"
+
+    def __init__(self, centroids: np.ndarray):
+        # (M, K, dsub)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.subvectors, self.k, self.dsub = self.centroids.shape
+
+    @classmethod
+    def train(cls, sample: np.ndarray, subvectors: int, seed: int = 0) -> "ProductQuantizer":
+        sample = np.asarray(sample, dtype=np.float32)
+        n, dim = sample.shape
+        if dim % subvectors:
+            raise ValueError(f"向量维度 {dim} 不能被子向量数 {subvectors} 整除")
+        dsub = dim // subvectors
+        k = min(PQ_CENTROIDS, n)
+        rng = np.random.default_rng(seed)
+        centroids = np.zeros((subvectors, k, dsub), dtype=np.float32)
+        for j in range(subvectors):
+            centroids[j] = _kmeans(sample[:, j * dsub:(j + 1) * dsub], k, rng)
+        return cls(centroids)
+
+    def code_size(self) -> int:
+        return self.subvectors
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((vectors.shape[0], self.subvectors), dtype=np.uint8)
+        for j in range(self.subvectors):
+            codes[:, j] = _nearest(vectors[:, j * self.dsub:(j + 1) * self.dsub], self.centroids[j])
+        return codes
+
+    def prepare(self, query_units: np.ndarray) -> np.ndarray:
+        """查找表 (M, m, K)：每个子空间中查询与各中心的内积"""
+        m = query_units.shape[0]
+        subs = query_units.reshape(m, self.subvectors, self.dsub)
+        return np.einsum("msd,skd->smk", subs, self.centroids)
+
+    def inner_products(self, lut: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """返回 (m, B) 的近似内积"""
+        scores = np.zeros((lut.shape[1], codes.shape[0]), dtype=np.float32)
+        for j in range(self.subvectors):
+            scores += lut[j][:, codes[:, j]]
+        return scores
+
+    def save(self, path: str):
+        np.savez(path, kind=self.kind, centroids=self.centroids)
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """返回每个向量最近中心的序号（平方 L2）"""
+    dist = (centroids ** 2).sum(axis=1)[None, :] - 2 * vectors @ centroids.T
+    return np.argmin(dist, axis=1)
+
+
+def _kmeans(vectors: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(PQ_ITERATIONS):
+        assign = _nearest(vectors, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.stack(
+            [np.bincount(assign, weights=vectors[:, d], minlength=k) for d in range(vectors.shape[1])], axis=1
+        ).astype(np.float32)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled][:, None]
+        # 空簇重新随机取点
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), size=len(empty), replace=False)]
+    return centroids
+
+
+def load_quantizer(path: str):
+    """从 save 生成的 .npz 文件恢复量化器"""
+    data = np.load(path)
+    kind = str(data["kind"])
+    if kind == ScalarQuantizer.kind:
+        return ScalarQuantizer(data["low"], data["scale"])
+    if kind == ProductQuantizer.kind:
+        return ProductQuantizer(data["centroids"])
+    raise ValueError(f"未知的量化类型: {kind}")
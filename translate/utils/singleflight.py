@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+"""
+@File    : singleflight.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/9/3 14:20
+"""
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """一次正在进行中的共享调用"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    合并相同键的并发异步调用：同一时刻相同键只执行一次，所有等待者共享结果。
+
+    单个等待者被取消不会影响共享调用；只有当最后一个等待者也离开时，
+    才会取消底层任务。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行或加入键为 key 的调用
+
+        Args:
+            key (str): 调用的唯一键，键相同的请求会被合并
+            factory (Callable): 无参函数，返回真正执行调用的协程
+
+        Returns:
+            Any: 共享调用的结果，异常也会传递给所有等待者
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self._leaders += 1
+        else:
+            self._coalesced += 1
+            logger.debug(f"合并进行中的请求: {key}")
+
+        call.waiters += 1
+        try:
+            # shield 保证等待者被取消时不会连带取消共享任务
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 最后一个等待者已离开，没有人再需要这个结果
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call):
+        # 任务完成后移除记录，后续相同请求将重新发起调用
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> Dict:
+        """返回发起调用数、被合并的请求数和当前进行中的调用数"""
+        return {
+            "leaders": self._leaders,
+            "coalesced": self._coalesced,
+            "in_flight": len(self._calls),
+        }
@@ -0,0 +1,23 @@
+import re
+import unicodedata
+
+"""
+@File    : text.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/9/18 10:00
+"""
+
+
+def normalize_text(text: str) -> str:
+    """
+    规范化文本用作缓存键：Unicode NFC、去除首尾空白、合并连续空白
+
+    Args:
+        text (str): 原始文本
+
+    Returns:
+        str: 规范化后的文本
+    """
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
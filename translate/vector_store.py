@@ -0,0 +1,552 @@
+"""
+@File    : vector_store.py
+@Project : TranslateAgent-CN
+@Author  : SunGo
+@Date    : 2025/09/26 15:20
+"""
+
+"""
+内存映射向量库模块：ChromaDB 之外的只读检索后端。
+
+每个知识库导出为一个版本目录：
+- vectors.bin: L2 归一化后的向量矩阵（float32 或 float16），通过 np.memmap 映射；
+- norms.f32: 每个向量的原始模长，与单位向量一起可精确还原 ChromaDB 的平方 L2 距离；
+- meta.jsonl + offsets.u64: 每行一个句对元数据，offsets 记录每行起始字节，按行号随机读取；
+- codes.u8 + quantizer.npz（可选）: int8 标量量化或乘积量化的压缩码字，检索时先在码字上粗排，
+  再从原始向量中读取少量候选做精确重排，常驻内存只有码字；
+- manifest.json: 维度、数据类型、压缩方式、条目数与对应 collection 的签名。
+<name>/CURRENT 指向当前版本，写入新版本后原子替换。多个 worker 进程映射同一组文件，
+由操作系统页缓存共享内存，打开时几乎没有加载开销。
+导出、发布与清理旧版本期间持有 <name>/.lock 文件锁，多个进程同时启动时只有一个进程导出。
+"""
+
+import os
+import json
+import mmap
+import time
+import uuid
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 下没有 fcntl，导出只在进程内互斥
+    fcntl = None
+
+import numpy as np
+
+from utils.quantization import ScalarQuantizer, ProductQuantizer, load_quantizer
+
+# 初始化日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 打分时每次处理的向量行数，限制中间结果的内存占用
+SEARCH_BLOCK_ROWS = 65536
+# 检查其他进程是否发布了新版本的最小间隔（秒）
+VERSION_CHECK_INTERVAL = 5
+
+DTYPES = {"float32": np.float32, "float16": np.float16}
+# 压缩方式：none 不压缩，sq8 为 int8 标量量化，pq 为乘积量化
+COMPRESSIONS = ("none", "sq8", "pq")
+# 训练量化器使用的最大样本数
+QUANTIZER_TRAIN_SAMPLES = 20000
+
+
+class MemmapCollection:
+    """
+    单个知识库某一版本的只读视图。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.count = self.manifest["count"]
+        self.dim = self.manifest["dim"]
+        self.signature = tuple(self.manifest["signature"]) if self.manifest.get("signature") else None
+        self.dtype = self.manifest["dtype"]
+        self.compression = self.manifest.get("compression", "none")
+        dtype = DTYPES[self.dtype]
+        if self.count:
+            self.vectors = np.memmap(os.path.join(path, "vectors.bin"), dtype=dtype, mode="r",
+                                     shape=(self.count, self.dim))
+            self.norms = np.memmap(os.path.join(path, "norms.f32"), dtype=np.float32, mode="r", shape=(self.count,))
+            self.offsets = np.memmap(os.path.join(path, "offsets.u64"), dtype=np.uint64, mode="r",
+                                     shape=(self.count + 1,))
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=dtype)
+            self.norms = np.zeros(0, dtype=np.float32)
+            self.offsets = np.zeros(1, dtype=np.uint64)
+        self.quantizer = None
+        self.codes = None
+        if self.compression != "none" and self.count:
+            self.quantizer = load_quantizer(os.path.join(path, "quantizer.npz"))
+            self.codes = np.memmap(os.path.join(path, "codes.u8"), dtype=np.uint8, mode="r",
+                                   shape=(self.count, self.quantizer.code_size()))
+        # 元数据文件同样以只读 mmap 访问，旧版本被替换后由垃圾回收释放
+        self._meta = None
+        if self.count:
+            with open(os.path.join(path, "meta.jsonl"), "rb") as f:
+                self._meta = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def metadata(self, row: int) -> Dict:
+        """按行号读取句对元数据"""
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._meta[start:end].decode("utf-8"))
+
+    def search(self, query_vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        精确 top-k 检索，距离为平方 L2（与 ChromaDB 默认距离一致）
+
+        Args:
+            query_vectors (np.ndarray): 形状为 (m, dim) 的查询向量（未归一化）
+            k (int): 每条查询返回的结果数
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (行号, 距离)，形状均为 (m, min(k, count))，按距离升序
+        """
+        query_units, query_norms = split_query(query_vectors)
+        return squared_l2_top_k(query_units, query_norms, self.vectors, self.norms, k)
+
+    def resident_bytes(self) -> int:
+        """检索时需要常驻内存的字节数：压缩时为码字与模长，否则为向量与模长"""
+        if self.codes is not None:
+            return self.codes.nbytes + self.norms.nbytes
+        return self.vectors.nbytes + self.norms.nbytes
+
+
+def squared_l2_top_k(query_units: np.ndarray, query_norms: np.ndarray, vectors: np.ndarray,
+                     norms: np.ndarray, k: int, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    单个向量矩阵上的精确 top-k，见 merged_top_k
+
+    Args:
+        rows: 只在这些行中检索，为 None 时检索全部行
+    """
+    _, best_rows, best_dist = merged_top_k(query_units, query_norms, [(vectors, norms, rows)], k)
+    return best_rows, best_dist
+
+
+def _running_top_k(m: int, k: int, blocks: Iterable[Tuple[int, np.ndarray, np.ndarray]]
+                   ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    在逐块产出的 (矩阵序号, 行号, 距离) 上维护每条查询的 top-k，返回按距离升序的结果
+    """
+    best_segs = np.zeros((m, 0), dtype=np.int64)
+    best_rows = np.zeros((m, 0), dtype=np.int64)
+    best_dist = np.zeros((m, 0), dtype=np.float32)
+    if k <= 0:
+        return best_segs, best_rows, best_dist
+
+    for seg, block_rows, dist in blocks:
+        width = len(block_rows)
+        cand_dist = np.concatenate([best_dist, dist], axis=1)
+        cand_rows = np.concatenate([best_rows, np.broadcast_to(block_rows, (m, width))], axis=1)
+        cand_segs = np.concatenate([best_segs, np.full((m, width), seg, dtype=np.int64)], axis=1)
+        keep = min(k, cand_dist.shape[1])
+        part = np.argpartition(cand_dist, keep - 1, axis=1)[:, :keep]
+        best_dist = np.take_along_axis(cand_dist, part, axis=1)
+        best_rows = np.take_along_axis(cand_rows, part, axis=1)
+        best_segs = np.take_along_axis(cand_segs, part, axis=1)
+
+    order = np.argsort(best_dist, axis=1)
+    return (
+        np.take_along_axis(best_segs, order, axis=1),
+        np.take_along_axis(best_rows, order, axis=1),
+        np.maximum(np.take_along_axis(best_dist, order, axis=1), 0.0),
+    )
+
+
+def _block_ranges(total: int, rows: Optional[np.ndarray], block_rows: int = SEARCH_BLOCK_ROWS):
+    """按块产出 (行号数组, 切片或行号)，rows 为 None 时按连续切片读取"""
+    for start in range(0, total, block_rows):
+        if rows is None:
+            stop = min(start + block_rows, total)
+            yield np.arange(start, stop), slice(start, stop)
+        else:
+            selected = np.asarray(rows[start:start + block_rows], dtype=np.int64)
+            yield selected, selected
+
+
+def merged_top_k(query_units: np.ndarray, query_norms: np.ndarray,
+                 segments: List[Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]],
+                 k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    在多个向量矩阵（如多个知识库）上一次扫描得到全局精确 top-k。
+    以单位向量与模长分块计算平方 L2 距离：||q - x||² = |q|² + |x|² - 2·|q|·|x|·cos(q, x)，
+    所有分块共用一个 top-k 状态，不拼接矩阵，内存占用与矩阵数量和大小无关。
+
+    Args:
+        query_units (np.ndarray): (m, dim) 单位查询向量
+        query_norms (np.ndarray): (m,) 查询向量模长
+        segments (List): (单位向量矩阵, 模长, 参与检索的行号或 None) 列表
+        k (int): 每条查询返回的结果数
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: (矩阵序号, 行号, 距离)，形状均为 (m, k')，按距离升序
+    """
+    query_sq = (query_norms ** 2)[:, None]
+
+    def blocks():
+        for seg, (vectors, norms, rows) in enumerate(segments):
+            total = vectors.shape[0] if rows is None else len(rows)
+            for block_rows, index in _block_ranges(total, rows):
+                block = np.asarray(vectors[index], dtype=np.float32)
+                block_norms = np.asarray(norms[index], dtype=np.float32)
+                cosine = query_units @ block.T
+                yield seg, block_rows, (query_sq + (block_norms ** 2)[None, :]
+                                        - 2 * query_norms[:, None] * block_norms[None, :] * cosine)
+
+    return _running_top_k(query_units.shape[0], k, blocks())
+
+
+def approximate_top_k(query_units: np.ndarray, query_norms: np.ndarray, views: List["MemmapCollection"],
+                      k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    用压缩码字估算距离的全局 top-k（粗排），未压缩的知识库直接计算精确距离。
+    模长按原值参与计算，只有夹角部分是近似的。
+    """
+    query_sq = (query_norms ** 2)[:, None]
+
+    def blocks():
+        for seg, view in enumerate(views):
+            if view.quantizer is None:
+                for block_rows, index in _block_ranges(view.count, None):
+                    block = np.asarray(view.vectors[index], dtype=np.float32)
+                    block_norms = np.asarray(view.norms[index], dtype=np.float32)
+                    cosine = query_units @ block.T
+                    yield seg, block_rows, (query_sq + (block_norms ** 2)[None, :]
+                                            - 2 * query_norms[:, None] * block_norms[None, :] * cosine)
+                continue
+            prepared = view.quantizer.prepare(query_units)
+            for block_rows, index in _block_ranges(view.count, None):
+                cosine = view.quantizer.inner_products(prepared, np.asarray(view.codes[index]))
+                block_norms = np.asarray(view.norms[index], dtype=np.float32)
+                yield seg, block_rows, (query_sq + (block_norms ** 2)[None, :]
+                                        - 2 * query_norms[:, None] * block_norms[None, :] * cosine)
+
+    return _running_top_k(query_units.shape[0], k, blocks())
+
+
+def rerank(query_units: np.ndarray, query_norms: np.ndarray, views: List["MemmapCollection"],
+           segs: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    对粗排候选读取原始向量计算精确距离，返回每条查询的精确 top-k
+    """
+    m = query_units.shape[0]
+    if m == 0:
+        return _running_top_k(0, 0, ())
+    best = [[], [], []]
+    for i in range(m):
+        segments = []
+        seg_ids = []
+        for seg in np.unique(segs[i]):
+            # 行号排序后读取，访问 memmap 时尽量顺序
+            candidates = np.sort(rows[i][segs[i] == seg])
+            segments.append((views[seg].vectors, views[seg].norms, candidates))
+            seg_ids.append(seg)
+        local_segs, local_rows, local_dist = merged_top_k(query_units[i:i + 1], query_norms[i:i + 1], segments, k)
+        best[0].append(np.asarray(seg_ids, dtype=np.int64)[local_segs[0]])
+        best[1].append(local_rows[0])
+        best[2].append(local_dist[0])
+    # 各查询的候选数相同（均为 min(候选数, 总行数)），可以直接堆叠
+    return np.stack(best[0]), np.stack(best[1]), np.stack(best[2])
+
+
+def split_query(query_vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """将查询向量拆分为单位向量与模长"""
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+    query_norms = np.linalg.norm(query_vectors, axis=1)
+    return query_vectors / np.maximum(query_norms, 1e-12)[:, None], query_norms
+
+
+def _version_stamp(entry: str) -> Optional[int]:
+    """版本目录名 v<毫秒时间戳>_<随机串> 中的时间戳，不是版本目录时返回 None"""
+    if not entry.startswith("v"):
+        return None
+    try:
+        return int(entry[1:].split("_", 1)[0])
+    except ValueError:
+        return None
+
+
+class MemmapVectorStore:
+    """
+    内存映射向量库：管理各知识库的版本目录，提供导出、打开与检索。
+    """
+
+    def __init__(self, root_dir: str, dtype: str = "float32", compression: str = "none",
+                 pq_subvectors: int = 48, rerank_factor: int = 10):
+        """
+        Args:
+            root_dir (str): 存储目录
+            dtype (str): 原始向量的存储类型，float32 或 float16
+            compression (str): none / sq8 / pq
+            pq_subvectors (int): 乘积量化的子向量数（每个向量的码字字节数），需整除向量维度
+            rerank_factor (int): 压缩检索时粗排候选数为 k 的多少倍
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"不支持的向量存储类型: {dtype}，可选 {list(DTYPES)}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"不支持的压缩方式: {compression}，可选 {list(COMPRESSIONS)}")
+        self.root_dir = root_dir
+        self.dtype = dtype
+        self.compression = compression
+        self.pq_subvectors = pq_subvectors
+        self.rerank_factor = max(1, rerank_factor)
+        os.makedirs(root_dir, exist_ok=True)
+        self._open: Dict[str, Tuple[str, MemmapCollection]] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # 本进程内的导出互斥，跨进程由 export_lock 中的文件锁保证
+        self._export_lock = threading.Lock()
+        self._searches = 0
+        self._exports = 0
+
+    def _current_version(self, name: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root_dir, name, "CURRENT"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def get(self, name: str, refresh: bool = False) -> Optional[MemmapCollection]:
+        """
+        打开知识库的当前版本，其他进程发布新版本后按间隔切换，尚未导出时返回 None。
+        refresh 为 True 时立即检查是否有新版本。
+        """
+        now = time.time()
+        with self._lock:
+            opened = self._open.get(name)
+            if opened is not None and not refresh and now - self._checked_at.get(name, 0) < VERSION_CHECK_INTERVAL:
+                return opened[1]
+            self._checked_at[name] = now
+            version = self._current_version(name)
+            if version is None:
+                self._open.pop(name, None)
+                return None
+            if opened is None or opened[0] != version:
+                collection = MemmapCollection(os.path.join(self.root_dir, name, version))
+                self._open[name] = (version, collection)
+                return collection
+            return opened[1]
+
+    @contextmanager
+    def export_lock(self, name: str):
+        """持有知识库的导出锁（进程内互斥 + <name>/.lock 文件锁）"""
+        collection_dir = os.path.join(self.root_dir, name)
+        os.makedirs(collection_dir, exist_ok=True)
+        with self._export_lock:
+            with open(os.path.join(collection_dir, ".lock"), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _try_get(self, name: str, refresh: bool = False) -> Optional[MemmapCollection]:
+        """打开当前版本，版本文件缺失或损坏时视为尚未导出"""
+        try:
+            return self.get(name, refresh=refresh)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"打开知识库 '{name}' 的内存映射版本失败，将重新导出: {e}")
+            with self._lock:
+                self._open.pop(name, None)
+            return None
+
+    def get_or_write(self, name: str, rows: Callable[[], Iterable[Tuple[np.ndarray, List[Dict]]]], dim: int,
+                     signature: Optional[tuple] = None) -> MemmapCollection:
+        """
+        返回与签名一致的当前版本，过期、缺失或无法打开时在导出锁内重新导出。
+        等待锁期间其他进程可能已导出了新版本，拿到锁后会再检查一次。
+
+        Args:
+            name (str): 知识库名称
+            rows (Callable): 需要导出时调用，返回逐批产出 (向量矩阵, 元数据列表) 的迭代器
+            dim (int): 向量维度
+            signature (tuple): 对应 collection 的签名
+
+        Returns:
+            MemmapCollection: 当前版本的视图
+        """
+        collection = self._try_get(name)
+        if self.is_current(collection, signature):
+            return collection
+        with self.export_lock(name):
+            collection = self._try_get(name, refresh=True)
+            if not self.is_current(collection, signature):
+                collection = self._write(name, rows(), dim, signature)
+        return collection
+
+    def write(self, name: str, rows: Iterable[Tuple[np.ndarray, List[Dict]]], dim: int,
+              signature: Optional[tuple] = None) -> MemmapCollection:
+        """
+        写入知识库的新版本并原子发布
+
+        Args:
+            name (str): 知识库名称
+            rows (Iterable): 逐批产出 (向量矩阵, 元数据列表)
+            dim (int): 向量维度
+            signature (tuple): 对应 collection 的签名（条目数, 构建时间），用于判断是否过期
+
+        Returns:
+            MemmapCollection: 新版本的视图
+        """
+        with self.export_lock(name):
+            return self._write(name, rows, dim, signature)
+
+    def _write(self, name: str, rows: Iterable[Tuple[np.ndarray, List[Dict]]], dim: int,
+               signature: Optional[tuple]) -> MemmapCollection:
+        """写入并发布新版本，调用方需持有 export_lock"""
+        collection_dir = os.path.join(self.root_dir, name)
+        previous = self._current_version(name)
+        version = f"v{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+        version_dir = os.path.join(collection_dir, version)
+        os.makedirs(version_dir)
+        dtype = DTYPES[self.dtype]
+
+        count = 0
+        offset = 0
+        try:
+            with open(os.path.join(version_dir, "vectors.bin"), "wb") as vectors_file, \
+                    open(os.path.join(version_dir, "norms.f32"), "wb") as norms_file, \
+                    open(os.path.join(version_dir, "meta.jsonl"), "wb") as meta_file, \
+                    open(os.path.join(version_dir, "offsets.u64"), "wb") as offsets_file:
+                offsets_file.write(np.array([0], dtype=np.uint64).tobytes())
+                for vectors, metadatas in rows:
+                    vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, dim)
+                    norms = np.linalg.norm(vectors, axis=1).astype(np.float32)
+                    units = vectors / np.maximum(norms, 1e-12)[:, None]
+                    vectors_file.write(units.astype(dtype).tobytes())
+                    norms_file.write(norms.tobytes())
+                    line_offsets = []
+                    for metadata in metadatas:
+                        line = (json.dumps(metadata, ensure_ascii=False) + "\n").encode("utf-8")
+                        meta_file.write(line)
+                        offset += len(line)
+                        line_offsets.append(offset)
+                    offsets_file.write(np.array(line_offsets, dtype=np.uint64).tobytes())
+                    count += len(metadatas)
+
+            if self.compression != "none" and count:
+                self._write_codes(version_dir, count, dim)
+
+            with open(os.path.join(version_dir, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "count": count,
+                    "dim": dim,
+                    "dtype": self.dtype,
+                    "compression": self.compression,
+                    "signature": list(signature) if signature else None,
+                    "created_at": time.time(),
+                }, f)
+
+            # 原子切换 CURRENT，正在读取旧版本的进程不受影响
+            current_tmp = os.path.join(collection_dir, f"CURRENT.{uuid.uuid4().hex[:8]}")
+            with open(current_tmp, "w", encoding="utf-8") as f:
+                f.write(version)
+            os.replace(current_tmp, os.path.join(collection_dir, "CURRENT"))
+        except BaseException:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            raise
+
+        # 清理比上一个当前版本更早的版本（包括中断导出留下的目录）。上一个版本保留到下次导出，
+        # 刚切换前打开它的进程仍可继续读取
+        if previous is not None:
+            previous_stamp = _version_stamp(previous)
+            for entry in os.listdir(collection_dir):
+                stamp = _version_stamp(entry)
+                if stamp is not None and stamp < previous_stamp and entry not in (previous, version):
+                    shutil.rmtree(os.path.join(collection_dir, entry), ignore_errors=True)
+
+        self._exports += 1
+        with self._lock:
+            self._checked_at.pop(name, None)
+        logger.info(f"已导出知识库 '{name}' 到内存映射向量库，共 {count} 条（{self.dtype}，压缩: {self.compression}）")
+        return self.get(name)
+
+    def _write_codes(self, version_dir: str, count: int, dim: int):
+        """
+        在已写入的单位向量上训练量化器并分块生成码字
+        """
+        vectors = np.memmap(os.path.join(version_dir, "vectors.bin"), dtype=DTYPES[self.dtype], mode="r",
+                            shape=(count, dim))
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(count, size=min(count, QUANTIZER_TRAIN_SAMPLES), replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+        if self.compression == "sq8":
+            quantizer = ScalarQuantizer.train(sample)
+        else:
+            quantizer = ProductQuantizer.train(sample, self.pq_subvectors)
+        quantizer.save(os.path.join(version_dir, "quantizer.npz"))
+        with open(os.path.join(version_dir, "codes.u8"), "wb") as codes_file:
+            for _, index in _block_ranges(count, None):
+                codes_file.write(quantizer.encode(np.asarray(vectors[index], dtype=np.float32)).tobytes())
+
+    def is_current(self, collection: Optional[MemmapCollection], signature: Optional[tuple]) -> bool:
+        """视图是否与 collection 签名及当前的存储配置一致"""
+        return (
+            collection is not None
+            and collection.signature == signature
+            and collection.dtype == self.dtype
+            and collection.compression == self.compression
+        )
+
+    def drop(self, name: str):
+        """删除知识库的全部版本"""
+        with self._lock:
+            self._open.pop(name, None)
+            self._checked_at.pop(name, None)
+        shutil.rmtree(os.path.join(self.root_dir, name), ignore_errors=True)
+
+    def search(self, collections: Dict[str, MemmapCollection], query_vectors: np.ndarray,
+               k: int) -> List[List[Tuple[float, str, Dict]]]:
+        """
+        在一个或多个知识库上做一次合并检索，返回全局 top-k 并读取命中行的元数据
+
+        Args:
+            collections (Dict): 知识库名称 → 视图
+            query_vectors (np.ndarray): (m, dim) 查询向量
+            k (int): 每条查询返回的结果数
+
+        Returns:
+            List[List[Tuple[float, str, Dict]]]: 每条查询的 (距离, 知识库名称, 元数据) 列表，按距离升序
+        """
+        self._searches += 1
+        names = list(collections)
+        views = [collections[name] for name in names]
+        query_units, query_norms = split_query(query_vectors)
+        if any(view.quantizer is not None for view in views):
+            # 码字粗排出 k * rerank_factor 个候选，再用原始向量精确重排
+            segs, rows, _ = approximate_top_k(query_units, query_norms, views, k * self.rerank_factor)
+            segs, rows, distances = rerank(query_units, query_norms, views, segs, rows, k)
+        else:
+            segs, rows, distances = merged_top_k(
+                query_units, query_norms, [(view.vectors, view.norms, None) for view in views], k
+            )
+        return [
+            [(float(distance), names[seg], views[seg].metadata(int(row)))
+             for seg, row, distance in zip(query_segs, query_rows, query_dist)]
+            for query_segs, query_rows, query_dist in zip(segs, rows, distances)
+        ]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            opened = {
+                name: {"count": c.count, "version": version, "resident_bytes": c.resident_bytes()}
+                for name, (version, c) in self._open.items()
+            }
+        return {
+            "dtype": self.dtype,
+            "compression": self.compression,
+            "searches": self._searches,
+            "exports": self._exports,
+            "collections": opened,
+        }
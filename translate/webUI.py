@@ -32,6 +32,8 @@ url = f"http://127.0.0.1:{Config.PORT}{Config.TRANSLATEAPI}"
 rag_url = f"http://127.0.0.1:{Config.PORT}/api/rag"  # RAG管理接口
 # 定义 HTTP 请求头，指定内容类型为 JSON
 headers = {"Content-Type": "application/json"}
+# 轮询知识库构建任务进度的间隔（秒）
+KB_JOB_POLL_INTERVAL = 1
 
 
 def send_message(user_message, translate_type):
@@ -125,25 +127,51 @@ def get_collections_list():
         logger.error(f"获取知识库列表异常: {e}")
         return []
 
+def format_build_progress(job):
+    """
+    将构建任务状态格式化为进度文本
+    """
+    progress = job.get("progress") or {}
+    rows_done = progress.get("rows_done", 0)
+    rows_total = progress.get("rows_total")
+    text = f"构建中... 已处理 {rows_done}" + (f"/{rows_total}" if rows_total else "") + " 行"
+    if progress.get("rows_per_sec"):
+        text += f"，{progress['rows_per_sec']} 行/秒"
+    if progress.get("eta_seconds") is not None:
+        text += f"，预计剩余 {progress['eta_seconds']} 秒"
+    return text
+
 def build_knowledge_base(file_path, current_kbs):
     """
-    上传文件并构建知识库
+    上传文件并提交构建任务，轮询任务进度直到结束
     """
     try:
         with open(file_path, 'rb') as f:
             files = {'file': f}
             response = requests.post(f"{rag_url}/collections", files=files, timeout=30)
-            
-        if response.status_code == 200:
-            result = response.json()
-            updated_list = get_collections_list()  # 重新获取列表
-            return updated_list, result.get("message", "操作完成")
-        else:
+
+        if response.status_code != 200:
             logger.error(f"构建知识库失败: {response.status_code}")
-            return current_kbs, f"构建失败: HTTP {response.status_code}"
+            yield current_kbs, f"构建失败: HTTP {response.status_code}"
+            return
+
+        job = response.json()
+        job_id = job["job_id"]
+        while job.get("status") in ("pending", "running"):
+            yield current_kbs, format_build_progress(job)
+            time.sleep(KB_JOB_POLL_INTERVAL)
+            response = requests.get(f"{rag_url}/jobs/{job_id}", headers=headers, timeout=10)
+            if response.status_code != 200:
+                logger.error(f"查询构建任务失败: {response.status_code}")
+                yield current_kbs, f"查询构建任务失败: HTTP {response.status_code}"
+                return
+            job = response.json()
+
+        updated_list = get_collections_list()  # 重新获取列表
+        yield updated_list, job.get("message") or "操作完成"
     except Exception as e:
         logger.error(f"构建知识库异常: {e}")
-        return current_kbs, f"构建失败: {str(e)}"
+        yield current_kbs, f"构建失败: {str(e)}"
 
 def delete_collections(selected_names, current_kbs):
     """